@@ -1,25 +1,146 @@
+import asyncio
 import logging
 import requests
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import BaseRequest
 from dotenv import load_dotenv
 import os
 import io
-import cairosvg
 import base64
+import hashlib
+import json
+from urllib.parse import urlencode
 from utils import upload_to_ipfs, generate_cosmic_svg, get_user_data
+from ipfs_cid import file_cid
+from webhook import MAX_CONCURRENT_UPDATES, serve
+from dispatch import PerUserUpdateProcessor
+from ratelimit import OutboundScheduler
+from sessions import SessionStore, UserSession
+from profiling import MAX_SECONDS, profiler
+from memprof import format_report, memory_profiler
+from http_cache import ConditionalCache
+from loop_watchdog import LOOP_WATCHDOG, LoopWatchdog
+from warmup import WARMUP, preload
+import metrics
 
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 API_URL = f"{os.getenv('BASE_URL')}/generate_music"  # FastAPI URL for music generation
+PIN_CONFIRM_URL = f"{os.getenv('BASE_URL')}/confirm_pin"  # Tells the API the audio is pinned
+PIN_CONFIRM_SECRET = os.getenv("PIN_CONFIRM_SECRET")  # Same as the API's, proves the confirmation comes from us
+
+# Telegram user ids allowed to run admin commands such as /profile
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Storing temp meta data
-user_metadata = {}
+# Storing temp meta data, bounded by SESSION_MAX_USERS and SESSION_TTL
+user_metadata = SessionStore()
+metrics.gauge("bot.sessions", user_metadata.stats)
+
+# NFT metadata keeps its ETag, so viewing an unchanged NFT again is a 304 instead of a full download
+nft_cache = ConditionalCache()
+
+# Reports handlers that hold the event loop (blocking I/O, CPU-heavy work) with their stack
+loop_watchdog = LoopWatchdog(metrics.histogram("bot.loop.lag_seconds"))
+metrics.gauge("bot.loop.blocked", loop_watchdog.snapshot)
+
+# Progress edits sent in the background, kept so they aren't garbage collected mid-flight
+progress_edits = set()
+# Audio uploads, which always run to the end: the API's mint waits for their confirmation
+pin_uploads = set()
+
+SESSION_EXPIRED_MSG = "⌛ Your session has expired. Please /register again and re-upload your track."
+
+
+def missing_session_text(user_id: int, default: str) -> str:
+    """Reply for a user without session data: tell evicted users their session expired."""
+    return SESSION_EXPIRED_MSG if user_metadata.expired(user_id) else default
+
+
+def show_progress(message, text: str) -> None:
+    """Edits a progress message without waiting for the chat's rate limit.
+
+    The rate limiter only sends the latest pending text of a message, so steps that finish
+    faster than the chat allows edits are skipped instead of slowing the handler down.
+    """
+    task = asyncio.create_task(message.edit_text(text))
+    progress_edits.add(task)
+    task.add_done_callback(_progress_sent)
+
+
+def _progress_sent(task: asyncio.Task) -> None:
+    progress_edits.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Progress update failed: {task.exception()}")
+
+
+def download_file(url: str, local_file_path: str) -> None:
+    """Downloads a Telegram file to disk (blocking, run it in a worker thread)."""
+    response = requests.get(url, timeout=60)
+    if response.status_code != 200:
+        raise Exception("Failed to download the file from Telegram.")
+
+    with open(local_file_path, "wb") as f:
+        f.write(response.content)  # Save the downloaded file
+
+
+def svg_to_png(svg_data: bytes) -> bytes:
+    """Renders an NFT image to PNG (blocking, run it in a worker thread)."""
+    # cairosvg loads libcairo through cffi, the biggest part of the bot's import time,
+    # so it's only imported with the first /get_nft (or by the warmup after startup)
+    import cairosvg
+    return cairosvg.svg2png(bytestring=svg_data)
+
+
+async def pin_music(local_file_path: str, cid: str) -> bool:
+    """Uploads the audio to IPFS and reports to the API whether it got pinned under the local `cid`."""
+    confirmation = {"cid": cid}
+    try:
+        music_data = await asyncio.to_thread(upload_to_ipfs, local_file_path)
+    except Exception as e:
+        logger.error(f"Upload of {cid} to IPFS failed: {e}")
+        music_data = None
+    if music_data:
+        confirmation["pinned_cid"] = music_data.removeprefix("ipfs://")
+    else:
+        confirmation["error"] = "Upload to IPFS failed."
+    response = await asyncio.to_thread(requests.post, PIN_CONFIRM_URL, json=confirmation, timeout=30,
+                                       headers={"X-Pin-Secret": PIN_CONFIRM_SECRET or ""})
+    # A refused confirmation (e.g. a wrong PIN_CONFIRM_SECRET) leaves the mint waiting, it's no pin
+    response.raise_for_status()
+    return confirmation.get("pinned_cid") == cid
+
+
+def start_pin(local_file_path: str, cid: str) -> asyncio.Task:
+    """Runs `pin_music` as a task that finishes even if the handler stops waiting for it.
+
+    The API deploys while the audio uploads and waits for the confirmation before it initializes
+    the contract, so an upload given up on would leave a paid deploy uninitialized.
+    """
+    task = asyncio.create_task(pin_music(local_file_path, cid))
+    pin_uploads.add(task)
+    task.add_done_callback(_pin_finished)
+    return task
+
+
+def _pin_finished(task: asyncio.Task) -> None:
+    pin_uploads.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Pin confirmation failed: {task.exception()}")
+
+
+def idempotency_key(user_id: int, file_id: str, data: dict) -> str:
+    """Same user minting the same file and metadata gets the same key, so retries reuse the first mint.
+
+    Edited metadata makes a new key, i.e. a new mint. The SVG is left out since every attempt draws a new one.
+    """
+    payload = json.dumps({name: value for name, value in data.items() if name != "svg_template"}, sort_keys=True)
+    return hashlib.sha256(f"{user_id}:{file_id}:{payload}".encode()).hexdigest()
 
 
 # Command for starting the bot
@@ -28,16 +149,17 @@ async def start(update: Update, context: CallbackContext) -> None:
     # Check if the user has a registered wallet
     if user_id in user_metadata:
 
-        user_data = get_user_data(str(user_id))  # Retrieve user data from FastAPI
+        user_data = await asyncio.to_thread(get_user_data, str(user_id))  # Retrieve user data from FastAPI
 
         if "status" in user_data and user_data["status"] == "error":
             await update.message.reply_text(user_data["message"])  # Send error message to user
         else:
-            user_metadata[user_id]["owner_address"] = user_data['wallet_address']
+            user_metadata[user_id].owner_address = user_data['wallet_address']
             await update.message.reply_text(f"✅ **Your wallet address is:**\n {user_data['wallet_address']}",
                                             parse_mode="Markdown")
     else:
-        await update.message.reply_text("🎵 Welcome to AI Music Bot! Please register at the web page: /register")
+        await update.message.reply_text(
+            missing_session_text(user_id, "🎵 Welcome to AI Music Bot! Please register at the web page: /register"))
 
 
 # Add this new command in your bot
@@ -46,7 +168,7 @@ async def register(update: Update, context: CallbackContext) -> None:
     user_id = update.message.from_user.id
 
     # Store the user's Telegram ID for later (so we can link it when they return)
-    user_metadata[user_id] = {"status": "awaiting_registration"}
+    user_metadata[user_id] = UserSession(status="awaiting_registration")
 
     # Send the registration link with userId as a query parameter
     ngrok = "https://a58a-81-177-214-101.ngrok-free.app"
@@ -68,9 +190,13 @@ async def register(update: Update, context: CallbackContext) -> None:
 async def approve_address(update: Update, context: CallbackContext):
     user_id = update.message.from_user.id
     """Handles the /approve_address command."""
+    if user_id not in user_metadata:
+        await update.message.reply_text(missing_session_text(user_id, "❌ Please /register first."))
+        return
+
     if context.args:
         wallet_address = context.args[0]  # Extract wallet address
-        user_metadata[user_id]["owner_address"] = wallet_address
+        user_metadata[user_id].owner_address = wallet_address
         await update.message.reply_text(
             f"✅ Address {wallet_address} approved successfully!\n\n"
             "🎵 Now it's time to bring your music to life!\n\n"
@@ -91,7 +217,11 @@ async def upload_music(update: Update, context: CallbackContext) -> None:
         return
 
     user_id = message.from_user.id
-    user_metadata[user_id]['file_id'] = file.file_id
+    if user_id not in user_metadata:
+        await message.reply_text(missing_session_text(user_id, "❌ Please /register first."))
+        return
+
+    user_metadata[user_id].file_id = file.file_id
 
     # Create inline keyboard with buttons for setting lyrics and title
     keyboard = [
@@ -112,7 +242,7 @@ async def set_lyrics(update: Update, context: CallbackContext) -> None:
     """Stores song lyrics."""
     user_id = update.message.from_user.id
     if user_id not in user_metadata:
-        await update.message.reply_text("❌ Please upload music first.")
+        await update.message.reply_text(missing_session_text(user_id, "❌ Please upload music first."))
         return
 
     lyrics = update.message.text.strip()  # Get the full message text including line breaks
@@ -122,7 +252,7 @@ async def set_lyrics(update: Update, context: CallbackContext) -> None:
         return
 
     # Save the lyrics with line breaks preserved
-    user_metadata[user_id]["lyrics"] = lyrics
+    user_metadata[user_id].lyrics = lyrics
     await update.message.reply_text("✅ Lyrics set!")
 
 
@@ -130,7 +260,7 @@ async def set_title(update: Update, context: CallbackContext) -> None:
     """Stores song title."""
     user_id = update.message.from_user.id
     if user_id not in user_metadata:
-        await update.message.reply_text("❌ Please upload music first.")
+        await update.message.reply_text(missing_session_text(user_id, "❌ Please upload music first."))
         return
 
     title = " ".join(context.args)
@@ -138,7 +268,7 @@ async def set_title(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("⚠️ Usage: `/set_title <song title>`")
         return
 
-    user_metadata[user_id]["title"] = title
+    user_metadata[user_id].title = title
     await update.message.reply_text("✅ Title set!")
 
 
@@ -146,7 +276,7 @@ async def change_address(update: Update, context: CallbackContext) -> None:
     """Stores wallet address."""
     user_id = update.message.from_user.id
     if user_id not in user_metadata:
-        await update.message.reply_text("❌ Please upload music first.")
+        await update.message.reply_text(missing_session_text(user_id, "❌ Please upload music first."))
         return
 
     address = " ".join(context.args)
@@ -154,20 +284,21 @@ async def change_address(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("⚠️ Invalid address! Example: `/set_address 0x123...456`")
         return
 
-    user_metadata[user_id]["owner_address"] = address
+    user_metadata[user_id].owner_address = address
     await update.message.reply_text("✅ Address set!")
 
 
 async def verify_data(update: Update, context: CallbackContext) -> None:
     """Displays stored metadata for user confirmation."""
     user_id = update.callback_query.from_user.id  # Use callback_query for inline buttons
-    if user_id not in user_metadata or "file_id" not in user_metadata[user_id]:
-        await update.callback_query.message.reply_text("❌ Please upload a music file first.")
+    if user_id not in user_metadata or user_metadata[user_id].file_id is None:
+        await update.callback_query.message.reply_text(
+            missing_session_text(user_id, "❌ Please upload a music file first."))
         return
 
     data = user_metadata[user_id]
-    print(f"\n\nUSER DATA: {data}\n\n")
-    missing = [key for key in ["title", "lyrics", "owner_address"] if key not in data]
+    logger.debug(f"Session of {user_id}: {data}")
+    missing = [key for key in ["title", "lyrics", "owner_address"] if getattr(data, key) is None]
 
     if missing:
         await update.callback_query.message.reply_text(f"⚠️ Missing data: {', '.join(missing)}")
@@ -175,9 +306,9 @@ async def verify_data(update: Update, context: CallbackContext) -> None:
 
     verification_msg = (
         f"✅ **Verify Your Data:**\n\n"
-        f"🎵 **Title:** {data['title']}\n"
-        f"🎶 **Lyrics:** {data['lyrics']}\n"
-        f"💰 **Address:** `{data['owner_address']}`\n\n"
+        f"🎵 **Title:** {data.title}\n"
+        f"🎶 **Lyrics:** {data.lyrics}\n"
+        f"💰 **Address:** `{data.owner_address}`\n\n"
         f"🚀 If correct, use `/generate_music` to mint your NFT!"
     )
 
@@ -195,57 +326,62 @@ async def verify_data(update: Update, context: CallbackContext) -> None:
 async def generate_music(update: Update, context: CallbackContext) -> None:
     """Sends the final request to mint NFT."""
     user_id = update.message.from_user.id
-    if user_id not in user_metadata or "file_id" not in user_metadata[user_id]:
-        await update.message.reply_text("❌ Please upload a music file first.")
+    if user_id not in user_metadata or user_metadata[user_id].file_id is None:
+        await update.message.reply_text(missing_session_text(user_id, "❌ Please upload a music file first."))
         return
 
+    # The mint writes its result back to the session, which must outlive it
+    user_metadata.pin(user_id)
     try:
         # Download music from Telegram
-        file_id = user_metadata[user_id]["file_id"]
+        file_id = user_metadata[user_id].file_id
         file = await context.bot.get_file(file_id)
         file_path = file.file_path
 
-        response = requests.get(file_path)
-        if response.status_code != 200:
-            raise Exception("Failed to download the file from Telegram.")
-
         local_file_path = f"/tmp/{file_id}.oga"  # Save the file locally
-        with open(local_file_path, "wb") as f:
-            f.write(response.content)  # Save the downloaded file
+        await asyncio.to_thread(download_file, file_path, local_file_path)
 
-        # Now upload the **local file** to IPFS
-        music_data = upload_to_ipfs(local_file_path)
+        # The CID is known before the upload, so the API deploys the contract while the audio is pinned
+        cid = await asyncio.to_thread(file_cid, local_file_path)
+        music_data = f"ipfs://{cid}"
+        pin_task = start_pin(local_file_path, cid)
 
-        print(f"\n\n{music_data}\n\n")
+        logger.debug(f"Minting {music_data} for {user_id}, pinning meanwhile")
         # response = requests.get(file_path)
         # music_data = base64.b64encode(response.content).decode()
 
         # Generate metadata
-        user_metadata[user_id]["meta"] = "Auto-generated metadata"
+        user_metadata[user_id].meta = "Auto-generated metadata"
 
         # Generate SVG template
-        title = user_metadata[user_id]["title"]
+        title = user_metadata[user_id].title
         svg_template = generate_cosmic_svg(title=title)
 
         data = {
-            "owner_address": user_metadata[user_id]["owner_address"],
+            "owner_address": user_metadata[user_id].owner_address,
             "symbol": "MUSICNFT",
             "title": title,
-            "lyrics": user_metadata[user_id]["lyrics"],
-            "meta": user_metadata[user_id]["meta"],
+            "lyrics": user_metadata[user_id].lyrics,
+            "meta": user_metadata[user_id].meta,
             "music_data": music_data,
-            "svg_template": svg_template
+            "svg_template": svg_template,
+            "pending_cid": cid
         }
 
         # Send to FastAPI
-        response = requests.post(API_URL, json=data, timeout=60)
+        response = await asyncio.to_thread(requests.post, API_URL, json=data, timeout=60,
+                                           headers={"Idempotency-Key": idempotency_key(user_id, file_id, data)})
+        pinned = await pin_task
 
-        if response.status_code == 200:
+        if not pinned:
+            await update.message.reply_text("⚠️ Your music couldn't be stored on IPFS. Try again later.")
+        elif response.status_code == 200:
             music_data = response.json()
 
             # Extract NFT data
             contract_address = music_data.get("contract_address", "N/A")
-            user_metadata[user_id]["nft_address"] = contract_address  # Save contract address
+            user_metadata[user_id].nft_address = contract_address  # Save contract address
+            user_metadata[user_id].nft_token_id = music_data.get("token_id", 1)
 
             # Extract relevant NFT data
             nft_details = (
@@ -254,6 +390,7 @@ async def generate_music(update: Update, context: CallbackContext) -> None:
                 f"🔢 **Block Number:** `{music_data.get('block_number', 'N/A')}`\n"
                 f"🔗 **Block Hash:** `{music_data.get('block_hash', 'N/A')}`\n"
                 f"🏛 **Contract Address:** `{contract_address}`\n"
+                f"🔖 **Token ID:** `{music_data.get('token_id', 1)}`\n"
                 f"⛽ **Gas Used:** `{music_data.get('gas_used', 'N/A')}`\n"
             )
 
@@ -264,6 +401,8 @@ async def generate_music(update: Update, context: CallbackContext) -> None:
     except Exception as e:
         logger.error(f"Error in generate_music: {e}")
         await update.message.reply_text("❌ An error occurred while processing your request.")
+    finally:
+        user_metadata.unpin(user_id)
 
 
 async def get_nft(update: Update, context: CallbackContext) -> None:
@@ -281,20 +420,21 @@ async def get_nft(update: Update, context: CallbackContext) -> None:
         return  # If it's neither a message nor a callback, return early
 
     # Check if user has an NFT
-    if user_id not in user_metadata or "nft_address" not in user_metadata[user_id]:
+    if user_id not in user_metadata or user_metadata[user_id].nft_address is None:
         # If it's a callback, use query.answer() to acknowledge the callback
         if update.callback_query:
             await query.answer()  # Answer the callback query
         # Send the "no NFT" message
-        await message.reply_text("❌ No NFT found. Use `/generate_music` first.")
+        await message.reply_text(missing_session_text(user_id, "❌ No NFT found. Use `/generate_music` first."))
         return
 
-    contract_address = user_metadata[user_id]["nft_address"]
-    nft_api_url = f"{os.getenv('BASE_URL')}/nft_metadata/{contract_address}"
+    contract_address = user_metadata[user_id].nft_address
+    token_id = user_metadata[user_id].nft_token_id
+    nft_api_url = f"{os.getenv('BASE_URL')}/nft_metadata/{contract_address}?token_id={token_id}"
 
     try:
         # Fetch NFT metadata
-        response = requests.get(nft_api_url, timeout=30)
+        response = await asyncio.to_thread(nft_cache.get, nft_api_url, timeout=30)
         if response.status_code != 200:
             # Acknowledge callback if it's a callback query
             if update.callback_query:
@@ -317,7 +457,7 @@ async def get_nft(update: Update, context: CallbackContext) -> None:
                 svg_data = base64.b64decode(image_base64)
 
                 # Convert SVG to PNG
-                png_data = cairosvg.svg2png(bytestring=svg_data)
+                png_data = await asyncio.to_thread(svg_to_png, svg_data)
 
                 # Prepare PNG file for Telegram
                 png_file = io.BytesIO(png_data)
@@ -362,11 +502,15 @@ async def get_nft(update: Update, context: CallbackContext) -> None:
 async def handle_message(update: Update, context: CallbackContext) -> None:
     user_id = update.message.from_user.id
 
+    if user_metadata.expired(user_id):
+        await update.message.reply_text(SESSION_EXPIRED_MSG)
+        return
+
     # Check if user is in the state of setting lyrics
-    if user_id in user_metadata and user_metadata[user_id].get("awaiting_lyrics"):
+    if user_id in user_metadata and user_metadata[user_id].awaiting_lyrics:
         lyrics = update.message.text
-        user_metadata[user_id]["lyrics"] = lyrics
-        user_metadata[user_id]["awaiting_lyrics"] = False  # Clear the state
+        user_metadata[user_id].lyrics = lyrics
+        user_metadata[user_id].awaiting_lyrics = False  # Clear the state
         await update.message.reply_text("✅ Lyrics set! Now, set your song title by clicking the button below.")
 
         # Send the button for setting the title after setting lyrics
@@ -378,10 +522,10 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
         return
 
     # Check if user is in the state of setting title
-    if user_id in user_metadata and user_metadata[user_id].get("awaiting_title"):
+    if user_id in user_metadata and user_metadata[user_id].awaiting_title:
         title = update.message.text
-        user_metadata[user_id]["title"] = title
-        user_metadata[user_id]["awaiting_title"] = False  # Clear the state
+        user_metadata[user_id].title = title
+        user_metadata[user_id].awaiting_title = False  # Clear the state
         await update.message.reply_text("✅ Title set! You're all set now. 🎉")
 
         # Send a button to verify the data
@@ -396,21 +540,25 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
 
 async def handle_callback(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
-    user_id = query.from_user.id
-
     if query is None:
-        print("Received an update that is not a callback query.")
+        logger.debug("Received an update that is not a callback query.")
         return  # Exit the function if it's not an inline button click
+    user_id = query.from_user.id
 
     data = query.data  # Callback data (e.g., "approve_0x298f9539e484D345CAd143461E4aA3136292a741")
 
     await query.answer()
 
+    # Everything below except viewing the NFT works on the user's session
+    if user_id not in user_metadata and data != "get_nft":
+        await query.message.reply_text(missing_session_text(user_id, "❌ Please /register first."))
+        return
+
     if data.startswith("approve_"):
         # Handle address approval logic
         wallet_address = data.split("_", 1)[1]  # Extract wallet address
         await query.answer()  # ✅ Acknowledge the button press
-        user_metadata[user_id]["owner_address"] = wallet_address
+        user_metadata[user_id].owner_address = wallet_address
 
         # Send a confirmation message
         await query.message.reply_text(
@@ -427,7 +575,7 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
         await query.message.reply_text("Please send me the lyrics for your song.")
 
         # Set the user's state to be awaiting lyrics input
-        user_metadata[user_id]["awaiting_lyrics"] = True
+        user_metadata[user_id].awaiting_lyrics = True
 
     elif data == "verify_data":
         # Call the verify_data function to display the stored metadata
@@ -440,7 +588,7 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
         await query.message.reply_text("Please send me the title of your song.")
 
         # Set the user's state to be awaiting title input
-        user_metadata[user_id]["awaiting_title"] = True
+        user_metadata[user_id].awaiting_title = True
 
     elif query.data == "get_nft":
         # Call the get_nft function when the user clicks "View Your NFT" button
@@ -449,66 +597,71 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
 
     elif data == "generate_music":
         # Check if the user has uploaded the music file and other necessary data
-        if user_id not in user_metadata or "file_id" not in user_metadata[user_id]:
+        if user_id not in user_metadata or user_metadata[user_id].file_id is None:
             await query.answer()  # Acknowledge the button press
-            await query.message.reply_text("❌ Please upload a music file first.")
+            await query.message.reply_text(missing_session_text(user_id, "❌ Please upload a music file first."))
             return
 
+        # The mint writes its result back to the session, which must outlive it
+        user_metadata.pin(user_id)
         try:
             # Initial message to indicate that something is happening
             processing_msg = await query.message.reply_text("🔄 Processing... Please wait.")
 
-            await processing_msg.edit_text("💾Processing your music file.")
+            show_progress(processing_msg, "💾Processing your music file.")
 
             # Download music from Telegram
-            file_id = user_metadata[user_id]["file_id"]
+            file_id = user_metadata[user_id].file_id
             file = await context.bot.get_file(file_id)
             file_path = file.file_path
 
-            response = requests.get(file_path)
-            if response.status_code != 200:
-                raise Exception("Failed to download the file from Telegram.")
-
             local_file_path = f"/tmp/{file_id}.oga"  # Save the file locally
-            with open(local_file_path, "wb") as f:
-                f.write(response.content)  # Save the downloaded file
+            await asyncio.to_thread(download_file, file_path, local_file_path)
 
-            await processing_msg.edit_text("🔄 Processing... Uploading to IPFS.")
-            # Now upload the **local file** to IPFS
-            music_data = upload_to_ipfs(local_file_path)
+            show_progress(processing_msg, "🔄 Processing... Uploading to IPFS.")
+            # The CID is known before the upload, so the API deploys the contract while the audio is pinned
+            cid = await asyncio.to_thread(file_cid, local_file_path)
+            music_data = f"ipfs://{cid}"
+            pin_task = start_pin(local_file_path, cid)
 
-            print(f"\n\n{music_data}\n\n")
+            logger.debug(f"Minting {music_data} for {user_id}, pinning meanwhile")
 
             # Generate metadata
-            user_metadata[user_id]["meta"] = "Auto-generated metadata"
+            user_metadata[user_id].meta = "Auto-generated metadata"
 
             # Generate SVG template
-            title = user_metadata[user_id]["title"]
+            title = user_metadata[user_id].title
 
-            await processing_msg.edit_text("📸Generating catchy image for your music.")
+            show_progress(processing_msg, "📸Generating catchy image for your music.")
             svg_template = generate_cosmic_svg(title=title)
 
             data = {
-                "owner_address": user_metadata[user_id]["owner_address"],
+                "owner_address": user_metadata[user_id].owner_address,
                 "symbol": "MUSICNFT",
                 "title": title,
-                "lyrics": user_metadata[user_id]["lyrics"],
-                "meta": user_metadata[user_id]["meta"],
+                "lyrics": user_metadata[user_id].lyrics,
+                "meta": user_metadata[user_id].meta,
                 "music_data": music_data,
-                "svg_template": svg_template
+                "svg_template": svg_template,
+                "pending_cid": cid
             }
 
-            await processing_msg.edit_text("🚀Minting your NFT. Please wait - we almost done!")
+            show_progress(processing_msg, "🚀Minting your NFT. Please wait - we almost done!")
 
             # Send to FastAPI
-            response = requests.post(API_URL, json=data, timeout=60)
+            response = await asyncio.to_thread(requests.post, API_URL, json=data, timeout=60,
+                                               headers={"Idempotency-Key": idempotency_key(user_id, file_id, data)})
+            pinned = await pin_task
 
-            if response.status_code == 200:
+            if not pinned:
+                await query.message.reply_text("⚠️ Your music couldn't be stored on IPFS. Try again later.")
+            elif response.status_code == 200:
                 music_data = response.json()
 
                 # Extract NFT data
                 contract_address = music_data.get("contract_address", "N/A")
-                user_metadata[user_id]["nft_address"] = contract_address  # Save contract address
+                user_metadata[user_id].nft_address = contract_address  # Save contract address
+                user_metadata[user_id].nft_token_id = music_data.get("token_id", 1)
 
 
                 # Extract relevant NFT data
@@ -518,6 +671,7 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
                     f"🔢 **Block Number:** `{music_data.get('block_number', 'N/A')}`\n"
                     f"🔗 **Block Hash:** `{music_data.get('block_hash', 'N/A')}`\n"
                     f"🏛 **Contract Address:** `{contract_address}`\n"
+                    f"🔖 **Token ID:** `{music_data.get('token_id', 1)}`\n"
                     f"⛽ **Gas Used:** `{music_data.get('gas_used', 'N/A')}`\n\n"
                     f"🚀 Your NFT has been successfully minted! 🎉"
                 )
@@ -539,10 +693,115 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
         except Exception as e:
             logger.error(f"Error in generate_music: {e}")
             await query.message.reply_text("❌ An error occurred while processing your request.")
+        finally:
+            user_metadata.unpin(user_id)
 
 
-def main():
-    app = Application.builder().token(TOKEN).build()
+async def search(update: Update, context: CallbackContext) -> None:
+    """Finds minted songs by title or lyrics. Usage: /search <words>"""
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("⚠️ Usage: `/search <words from the title or lyrics>`", parse_mode="Markdown")
+        return
+
+    search_url = f"{os.getenv('BASE_URL')}/search?{urlencode({'q': query, 'limit': 5})}"
+    try:
+        response = await asyncio.to_thread(requests.get, search_url, timeout=10)
+        results = response.json()["results"] if response.status_code == 200 else None
+    except Exception as e:
+        logger.error(f"Error searching songs: {e}")
+        results = None
+
+    if results is None:
+        await update.message.reply_text("⚠️ Search is unavailable right now. Try again later.")
+        return
+    if not results:
+        await update.message.reply_text(f"🔍 No songs found for \"{query}\".")
+        return
+
+    lines = [f"🔍 Songs matching \"{query}\":\n"]
+    for result in results:
+        lines.append(f"🎵 {result['title']} (token {result['token_id']})\n🏛 {result['contract_address']}")
+        if result.get("snippet"):
+            lines.append(f"🎶 {result['snippet']}")
+        lines.append("")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def profile(update: Update, context: CallbackContext) -> None:
+    """Admin only: profiles the bot process. Usage: /profile [seconds] [sample|cprofile]"""
+    if update.message.from_user.id not in ADMIN_USER_IDS:
+        return
+
+    try:
+        seconds = min(float(context.args[0]) if context.args else 30.0, MAX_SECONDS)
+        mode = context.args[1] if len(context.args) > 1 else "sample"
+        profiler.start(mode=mode, seconds=seconds)
+    except (RuntimeError, ValueError) as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_text(f"⏱ Profiling the bot ({mode}) for {seconds:g}s...")
+    await asyncio.sleep(seconds)
+    result = profiler.stop() or profiler.last_result
+
+    # Collapsed stacks go straight into flamegraph.pl / speedscope
+    content = result.collapsed() if result.mode == "sample" else result.pstats_text()
+    document = io.BytesIO(content.encode())
+    document.name = f"bot-{result.mode}.txt"
+    count = f"{result.samples} samples" if result.mode == "sample" else f"{len(result.stats.stats)} functions"
+    await update.message.reply_document(document=document, caption=f"🔥 {result.duration:.1f}s profile, {count}")
+
+
+async def memprof(update: Update, context: CallbackContext) -> None:
+    """Admin only: heap profiling of the bot. Usage: /memprof start|baseline|top|diff|stop [limit] [lineno|filename]"""
+    if update.message.from_user.id not in ADMIN_USER_IDS:
+        return
+
+    action = context.args[0] if context.args else "diff"
+    try:
+        limit = int(context.args[1]) if len(context.args) > 1 else 25
+        group_by = context.args[2] if len(context.args) > 2 else "lineno"
+        if action == "start":
+            await asyncio.to_thread(memory_profiler.start)
+            await update.message.reply_text("🧠 Tracing allocations. Send /memprof diff to see what grew since now.")
+            return
+        if action == "baseline":
+            await asyncio.to_thread(memory_profiler.baseline)
+            await update.message.reply_text("🧠 New baseline taken.")
+            return
+        if action == "stop":
+            memory_profiler.stop()
+            await update.message.reply_text("🧠 Allocation tracing stopped.")
+            return
+        if action not in ("top", "diff"):
+            raise ValueError("Usage: /memprof start|baseline|top|diff|stop [limit] [lineno|filename]")
+        # Snapshots take a while on a big heap, the worker thread keeps the loop turning meanwhile
+        report = await asyncio.to_thread(memory_profiler.top if action == "top" else memory_profiler.diff,
+                                         limit, group_by)
+    except (RuntimeError, ValueError) as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    document = io.BytesIO(format_report(report).encode())
+    document.name = f"bot-memory-{action}.txt"
+    await update.message.reply_document(document=document, caption=f"🧠 Top {len(report['sites'])} allocation sites")
+
+
+def build_application(token: str = TOKEN, request: BaseRequest = None) -> Application:
+    # Handlers run concurrently, so one slow mint doesn't hold up other users,
+    # while updates of the same user stay in order
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        # Outgoing calls are throttled per chat and globally, progress edits get coalesced
+        .rate_limiter(OutboundScheduler())
+    )
+    if request is not None:
+        # Custom Bot API transport, e.g. the stubbed one of the load harness
+        builder = builder.request(request)
+    app = builder.build()
 
     app.add_handler(CallbackQueryHandler(handle_callback))
 
@@ -559,9 +818,31 @@ def main():
     app.add_handler(CommandHandler("verify_data", verify_data))
     app.add_handler(CommandHandler("generate_music", generate_music))
     app.add_handler(CommandHandler("get_nft", get_nft))
+    app.add_handler(CommandHandler("search", search))
+    app.add_handler(CommandHandler("profile", profile))
+    app.add_handler(CommandHandler("memprof", memprof))
+
+    return app
+
+
+async def run(app: Application) -> None:
+    if LOOP_WATCHDOG:
+        loop_watchdog.start()
+    # Load the image renderer while the bot is already taking updates
+    warmup_task = asyncio.create_task(preload("cairosvg")) if WARMUP else None
+    try:
+        await serve(app)
+    finally:
+        if warmup_task is not None:
+            warmup_task.cancel()
+        loop_watchdog.stop()
+
+
+def main():
+    app = build_application()
 
     logger.info("Bot is running...")
-    app.run_polling()
+    asyncio.run(run(app))
 
 
 if __name__ == "__main__":
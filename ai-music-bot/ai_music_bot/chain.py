@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+
+from fastapi import HTTPException
+
+from .rpc_pool import is_endpoint_error, rpc_pool
+from .subprocesses import executor
+from .utils import restore_data
+
+logger = logging.getLogger(__name__)
+
+# tokenURI JSON fields and the contract getter returning each one on its own
+FIELD_GETTERS = {
+    "name": "tokenTitle(uint256)",
+    "lyrics": "tokenLyrics(uint256)",
+    "description": "tokenDescription(uint256)",
+    "image": "tokenImage(uint256)",
+    "music": "tokenMusic(uint256)",
+}
+# Contracts deployed before the per-token getters only have these, for token 1
+LEGACY_GETTERS = {"name": "title()", "lyrics": "lyrics()", "music": "music()"}
+
+_legacy_contracts = set()
+
+
+class ContractError(Exception):
+    """The node answered, but the call itself failed (e.g. reverted)."""
+
+
+async def _cast_call(slot, rpc_url: str, contract_address: str, signature: str, *args: str) -> tuple[int, str, str]:
+    command = [
+        "cast", "call", contract_address,
+        "--rpc-url", rpc_url,
+        signature,
+        *args
+    ]
+
+    try:
+        result = await slot.run(*command)
+    except TimeoutError:
+        raise TimeoutError(f"cast call to {rpc_url} timed out.")
+
+    stderr = result.stderr.strip()
+    if result.returncode != 0 and is_endpoint_error(stderr):
+        raise ConnectionError(f"cast call to {rpc_url} failed: {stderr}")
+    return result.returncode, result.stdout.strip(), stderr
+
+
+async def cast_call(contract_address: str, signature: str, *args: str) -> str:
+    """Runs a read-only contract call, failing over to another RPC node if the first one fails."""
+    tried = []
+    while True:
+        rpc_url = rpc_pool.read_url(exclude=tuple(tried))
+        tried.append(rpc_url)
+        try:
+            # Reads have their own slots and the highest priority, so pending deploys don't delay them
+            async with executor.slot("read") as slot:
+                with rpc_pool.track(rpc_url):
+                    returncode, stdout, stderr = await _cast_call(slot, rpc_url, contract_address, signature, *args)
+        except (ConnectionError, TimeoutError) as e:
+            if len(tried) >= min(2, len(rpc_pool.endpoints)):
+                raise
+            logger.warning(f"{e} Retrying on another RPC node.")
+            continue
+
+        if returncode != 0:
+            raise ContractError(stderr)
+        return stdout
+
+
+def decode_string(raw_output: str) -> str:
+    """Decodes the ABI-encoded `string` returned by `cast call`."""
+    # eth_abi is a good part of the API's import time, so it's loaded with the first metadata read
+    from eth_abi import decode
+
+    if raw_output.startswith("0x"):
+        raw_output = raw_output[2:]
+    return decode(["string"], binascii.unhexlify(raw_output))[0]
+
+
+async def _read_field(contract_address: str, signature: str, field: str, *args: str) -> str:
+    value = decode_string(await cast_call(contract_address, signature, *args))
+    # Lyrics are stored with their newlines escaped
+    return restore_data(value) if field == "lyrics" else value
+
+
+async def _read_legacy_fields(contract_address: str, token_id: int, fields: list) -> dict:
+    direct = [field for field in fields if field in LEGACY_GETTERS] if token_id == 1 else []
+    rest = [field for field in fields if field not in direct]
+
+    reads = [_read_field(contract_address, LEGACY_GETTERS[field], field) for field in direct]
+    if rest:
+        # Description and image can only come from the full document
+        reads.append(get_nft_metadata_from_contract(contract_address, token_id))
+    results = await asyncio.gather(*reads)
+
+    metadata = dict(zip(direct, results))
+    if rest:
+        metadata.update({field: results[-1].get(field) for field in rest})
+    return metadata
+
+
+async def get_nft_metadata_fields(contract_address: str, token_id: int, fields: list) -> dict:
+    """Reads only the requested tokenURI fields, in parallel, through the per-field getters."""
+    unknown = [field for field in fields if field not in FIELD_GETTERS]
+    if unknown or not fields:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown fields {unknown}, expected some of: {', '.join(FIELD_GETTERS)}.")
+    if not contract_address.startswith("0x"):
+        raise HTTPException(status_code=500, detail="Invalid contract address.")
+
+    logger.info(f"Fetching NFT metadata fields {fields}: {contract_address} token {token_id}")
+    try:
+        if contract_address.lower() not in _legacy_contracts:
+            try:
+                values = await asyncio.gather(*(
+                    _read_field(contract_address, FIELD_GETTERS[field], field, str(token_id)) for field in fields
+                ))
+                return dict(zip(fields, values))
+            except ContractError as e:
+                logger.info(f"Per-field getters failed on {contract_address} ({e}), trying the legacy ones.")
+
+        metadata = await _read_legacy_fields(contract_address, token_id, fields)
+        # Only remembered once the legacy getters worked, a bad token id is no reason to
+        _legacy_contracts.add(contract_address.lower())
+        return metadata
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching NFT metadata fields: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_nft_metadata_from_contract(contract_address: str, token_id: int = 1):
+    """Calls the smart contract to get NFT metadata using cast call and decodes ABI-encoded response."""
+    try:
+        # Validate contract address
+        if not contract_address.startswith("0x"):
+            raise ValueError("Invalid contract address.")
+
+        logger.info(f"Fetching NFT metadata: {contract_address} tokenURI({token_id})")
+
+        # Fetch tokenURI from the fastest healthy RPC node
+        raw_output = await cast_call(contract_address, "tokenURI(uint256)", str(token_id))
+
+        logger.info(f"Raw NFT Metadata Response: {raw_output}")
+
+        if not raw_output:
+            raise HTTPException(status_code=500, detail="Failed to fetch NFT metadata.")
+
+        # Step 1: Decode the ABI-encoded `string` response
+        decoded_data = decode_string(raw_output)
+
+        # Step 2: Extract Base64 JSON part and fix padding
+        metadata_base64 = decoded_data.replace("data:application/json;base64,", "").strip()
+        missing_padding = len(metadata_base64) % 4
+        if missing_padding:
+            metadata_base64 += "=" * (4 - missing_padding)
+
+        # Step 3: Decode Base64 JSON
+        metadata_json = base64.b64decode(metadata_base64).decode()
+        metadata_dict = json.loads(metadata_json)
+
+        logging.info(f"\n\nnft_data: {metadata_dict}\n\n")
+
+        metadata_dict["lyrics"] = restore_data(metadata_dict["lyrics"])
+
+        return metadata_dict
+
+    except Exception as e:
+        logger.error(f"Error fetching NFT metadata: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+
+from . import metrics
+from .subprocesses import executor
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.join(os.getcwd(), "purrtunes_contract")
+CACHE_DIR = os.getenv("CONTRACT_CACHE_DIR", os.path.expanduser("~/.cache/purrtunes/wasm"))
+WASM_TARGET = "wasm32-unknown-unknown"
+
+# Inputs that change the compiled WASM
+# (.cargo/config.toml sets the wasm32 rustflags, e.g. the stack size)
+SOURCE_FILES = ("Cargo.toml", "Cargo.lock", "rust-toolchain.toml", os.path.join(".cargo", "config.toml"))
+
+_lock = asyncio.Lock()
+_wasm_path = None
+
+# Per lookup, i.e. per deploy (and the prebuild); a miss is a build
+cache_hits = metrics.counter("api.contract_wasm.cache_hits")
+cache_misses = metrics.counter("api.contract_wasm.cache_misses")
+
+
+async def _run(*command: str, cwd: str) -> str:
+    # Builds share the executor's "build" class (BUILD_TIMEOUT, SUBPROCESS_BUILD_LIMIT) with lowest priority
+    result = await executor.run("build", *command, cwd=cwd)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed: {result.stderr}")
+    return result.stdout
+
+
+async def source_hash(project_dir: str = PROJECT_DIR) -> str:
+    """Hashes the contract sources, Cargo manifests and config, and the toolchain in use."""
+    digest = hashlib.sha256()
+
+    paths = [os.path.join(project_dir, name) for name in SOURCE_FILES]
+    for root, _, files in os.walk(os.path.join(project_dir, "src")):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(".rs"))
+
+    for path in sorted(paths):
+        if os.path.exists(path):
+            digest.update(os.path.relpath(path, project_dir).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+
+    # rust-toolchain.toml is honoured because we run from the project directory
+    digest.update((await _run("rustc", "--version", cwd=project_dir)).encode())
+    digest.update((await _run("cargo", "stylus", "--version", cwd=project_dir)).encode())
+
+    return digest.hexdigest()
+
+
+async def _build(project_dir: str, cached_path: str) -> None:
+    await _run("cargo", "build", "--lib", "--release", f"--target={WASM_TARGET}", cwd=project_dir)
+
+    release_dir = os.path.join(project_dir, "target", WASM_TARGET, "release")
+    wasm_files = [name for name in os.listdir(release_dir) if name.endswith(".wasm")]
+    if len(wasm_files) != 1:
+        raise ValueError(f"Expected one WASM artifact in {release_dir}, found: {wasm_files}")
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Copy then rename, so a concurrent reader never sees a partial file
+    tmp_path = f"{cached_path}.tmp"
+    shutil.copyfile(os.path.join(release_dir, wasm_files[0]), tmp_path)
+    os.replace(tmp_path, cached_path)
+
+
+async def ensure_contract_wasm(project_dir: str = PROJECT_DIR) -> str:
+    """Returns the path of the prebuilt contract WASM, building it only on a cache miss."""
+    global _wasm_path
+
+    async with _lock:
+        if _wasm_path and os.path.exists(_wasm_path):
+            cache_hits.inc()
+            logger.debug(f"Contract WASM cache hit: {_wasm_path}")
+            return _wasm_path
+
+        key = await source_hash(project_dir)
+        cached_path = os.path.join(CACHE_DIR, f"{key}.wasm")
+
+        if os.path.exists(cached_path):
+            cache_hits.inc()
+            logger.info(f"Contract WASM cache hit: {cached_path}")
+        else:
+            cache_misses.inc()
+            logger.info(f"Contract WASM cache miss for {key[:12]}, building...")
+            start_time = asyncio.get_event_loop().time()
+            await _build(project_dir, cached_path)
+            logger.info(f"Contract WASM built in {asyncio.get_event_loop().time() - start_time:.1f}s: {cached_path}")
+
+        _wasm_path = cached_path
+        return _wasm_path
+
+
+async def prebuild() -> None:
+    """Warms the cache in the background, a failure here is retried by the first deploy."""
+    try:
+        await ensure_contract_wasm()
+    except Exception as e:
+        logger.error(f"Error prebuilding contract: {e}")
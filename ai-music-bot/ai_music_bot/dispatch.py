@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import time
+
+from telegram import Update
+
+import metrics
+from webhook import DrainingUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+USER_QUEUE_SIZE = int(os.getenv("BOT_USER_QUEUE_SIZE", "8"))  # Pending updates kept per user
+USER_IDLE_TIMEOUT = float(os.getenv("BOT_USER_IDLE_TIMEOUT", "60"))  # Seconds before an idle queue is evicted
+
+queue_wait = metrics.histogram("bot.dispatch.queue_wait_seconds")
+dropped_updates = metrics.counter("bot.dispatch.dropped_updates")
+evicted_lanes = metrics.counter("bot.dispatch.evicted_queues")
+
+
+class _Lane:
+    """Pending updates of a single user plus the worker draining them in order."""
+
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.worker = None
+
+
+class PerUserUpdateProcessor(DrainingUpdateProcessor):
+    """Runs updates of the same user strictly in order, and different users in parallel.
+
+    Handlers mutate `user_metadata[user_id]` across awaits, so two updates of one user must
+    never interleave. Each user gets a bounded FIFO with its own worker, which is evicted
+    after `idle_timeout` seconds without updates. A concurrency slot is only taken by the worker
+    while a handler runs, so updates queued behind one user don't hold back the others.
+    """
+
+    def __init__(self, max_concurrent_updates: int, queue_size: int = USER_QUEUE_SIZE,
+                 idle_timeout: float = USER_IDLE_TIMEOUT, **kwargs):
+        super().__init__(max_concurrent_updates, **kwargs)
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self._lanes = {}
+        metrics.gauge("bot.dispatch.active_queues", lambda: len(self._lanes))
+
+    async def process_update(self, update, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            # Nothing user-specific to serialize on (e.g. polls, channel posts)
+            await super().process_update(update, coroutine)
+            return
+
+        lane = self._lanes.get(user.id)
+        if lane is None:
+            lane = self._lanes[user.id] = _Lane(self.queue_size)
+            lane.worker = asyncio.create_task(self._run_lane(user.id, lane))
+
+        try:
+            # The lane worker runs it from here on
+            lane.queue.put_nowait((time.perf_counter(), update, coroutine))
+        except asyncio.QueueFull:
+            dropped_updates.inc()
+            coroutine.close()
+            logger.warning(f"Dropping update {update.update_id}: user {user.id} has {self.queue_size} pending.")
+
+    async def _run_lane(self, user_id: int, lane: _Lane) -> None:
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(lane.queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if lane.queue.empty():
+                        evicted_lanes.inc()
+                        return
+                    continue
+
+                enqueued_at, update, coroutine = item
+                try:
+                    async with self._semaphore:
+                        queue_wait.observe(time.perf_counter() - enqueued_at)
+                        await self.do_process_update(update, coroutine)
+                except Exception:
+                    logger.exception(f"Update {update.update_id} failed.")
+                finally:
+                    lane.queue.task_done()
+        finally:
+            if self._lanes.get(user_id) is lane:
+                del self._lanes[user_id]
+
+    def _cancel_in_flight(self) -> None:
+        # Updates that never started are skipped rather than run after the drain deadline
+        for lane in self._lanes.values():
+            while not lane.queue.empty():
+                _, update, coroutine = lane.queue.get_nowait()
+                coroutine.close()
+                lane.queue.task_done()
+                logger.warning(f"Update {update.update_id} skipped after drain timeout.")
+        super()._cancel_in_flight()
+
+    async def wait_drained(self) -> None:
+        # Queued updates count as in flight too: run them, or skip them once the drain times out
+        await asyncio.gather(*(lane.queue.join() for lane in list(self._lanes.values())))
+        await super().wait_drained()
+
+    async def shutdown(self) -> None:
+        await super().shutdown()
+        for lane in list(self._lanes.values()):
+            lane.worker.cancel()
+        logger.info(f"Dispatch metrics: {metrics.snapshot()}")
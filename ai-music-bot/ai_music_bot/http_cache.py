@@ -0,0 +1,58 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", "256"))
+
+revalidated = metrics.counter("bot.http_cache.revalidated")
+fetched = metrics.counter("bot.http_cache.fetched")
+
+
+class ConditionalCache:
+    """Remembers GET responses that carry an ETag and revalidates them with If-None-Match.
+
+    A 304 from the server returns the stored response, so unchanged payloads are not
+    downloaded again. Safe to use from worker threads; bounded to `max_entries` URLs (LRU).
+    """
+
+    def __init__(self, http=requests, max_entries: int = HTTP_CACHE_MAX_ENTRIES):
+        self.http = http
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # url -> response with an ETag
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str, timeout: float = 30, headers: dict = None):
+        with self._lock:
+            cached = self._entries.get(url)
+
+        headers = dict(headers or {})
+        if cached is not None:
+            headers["If-None-Match"] = cached.headers["ETag"]
+
+        response = self.http.get(url, timeout=timeout, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            revalidated.inc()
+            with self._lock:
+                if url in self._entries:
+                    self._entries.move_to_end(url)
+            return cached
+
+        fetched.inc()
+        if response.status_code == 200 and response.headers.get("ETag"):
+            with self._lock:
+                self._entries[url] = response
+                self._entries.move_to_end(url)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return response
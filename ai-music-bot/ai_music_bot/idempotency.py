@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+replayed = metrics.counter("api.idempotency.replayed")
+attached = metrics.counter("api.idempotency.attached")
+conflicts = metrics.counter("api.idempotency.conflicts")
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key reused for a request with a different body."""
+
+
+class IdempotencyStore:
+    """Remembers the job started for each idempotency key, bounded in size and age.
+
+    A repeated key attaches to the in-flight job or gets its stored result back, so a
+    client retry never starts the same chain work twice. Failed jobs are forgotten, so
+    they can be retried. Each key remembers a fingerprint of its request, and the same key
+    with another fingerprint is refused rather than answered with the first job's result.
+    """
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._jobs = OrderedDict()  # key -> (created_at, fingerprint, task)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    async def run(self, key: str, job, fingerprint: str = None):
+        """Returns the result of `job()` for `key`, running it at most once per key.
+
+        Raises IdempotencyConflict if `key` was first used with a different `fingerprint`.
+        """
+        self._expire()
+
+        entry = self._jobs.get(key)
+        if entry is not None:
+            if entry[1] != fingerprint:
+                conflicts.inc()
+                raise IdempotencyConflict(f"Idempotency key {key} was already used for a different request.")
+            task = entry[2]
+            (replayed if task.done() else attached).inc()
+            logger.info(f"Idempotency key {key} already seen, reusing its job.")
+        else:
+            task = asyncio.create_task(job())
+            task.add_done_callback(lambda t: self._forget_failed(key, t))
+            self._jobs[key] = (time.monotonic(), fingerprint, task)
+            self._evict()
+
+        # Shielded: a client giving up on the request must not cancel the job for the others
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, key: str, task: asyncio.Task) -> None:
+        if (task.cancelled() or task.exception() is not None) and self._jobs.get(key, (None,) * 3)[2] is task:
+            del self._jobs[key]
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        while self._jobs:
+            key, (created_at, _, task) = next(iter(self._jobs.items()))
+            if created_at > deadline or not task.done():
+                break
+            del self._jobs[key]
+
+    def _evict(self) -> None:
+        # Oldest finished jobs go first, in-flight ones are kept until they finish
+        for key in [key for key, (_, _, task) in self._jobs.items() if task.done()]:
+            if len(self._jobs) <= self.max_keys:
+                break
+            del self._jobs[key]
@@ -0,0 +1,95 @@
+import hashlib
+
+# CIDv0 of a file as `ipfs add` (and Pinata with cidVersion 0) computes it: 256 KiB chunks wrapped
+# in UnixFS dag-pb leaves, a balanced DAG of at most 174 links per node, sha256 multihashes.
+# Like go-unixfs, the first leaf is typed File and every later one Raw
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_UNIXFS_RAW = 0
+_UNIXFS_FILE = 2
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def b58encode(data: bytes) -> str:
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = _B58_ALPHABET[remainder] + encoded
+    # Leading zero bytes are kept as leading "1"s
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + encoded
+
+
+def _multihash(block: bytes) -> bytes:
+    return b"\x12\x20" + hashlib.sha256(block).digest()
+
+
+class _Node:
+    """A serialized block of the DAG: its multihash, cumulative DAG size and file bytes below it."""
+
+    def __init__(self, block: bytes, dag_size: int, file_size: int):
+        self.multihash = _multihash(block)
+        self.dag_size = dag_size
+        self.file_size = file_size
+
+
+def _leaf(chunk: bytes, first: bool = True) -> _Node:
+    unixfs_type = _UNIXFS_FILE if first else _UNIXFS_RAW
+    unixfs = _uint_field(1, unixfs_type) + (_field(2, chunk) if chunk else b"") + _uint_field(3, len(chunk))
+    block = _field(1, unixfs)
+    return _Node(block, len(block), len(chunk))
+
+
+def _parent(children: list) -> _Node:
+    file_size = sum(child.file_size for child in children)
+    unixfs = _uint_field(1, _UNIXFS_FILE) + _uint_field(3, file_size) + \
+        b"".join(_uint_field(4, child.file_size) for child in children)
+    # dag-pb writes the links before the data; go-ipfs always sets the (empty) link name
+    links = b"".join(_field(2, _field(1, child.multihash) + _field(2, b"") + _uint_field(3, child.dag_size))
+                     for child in children)
+    block = links + _field(1, unixfs)
+    return _Node(block, len(block) + sum(child.dag_size for child in children), file_size)
+
+
+def _root(leaves: list) -> _Node:
+    # Grouping level by level gives the same tree as the balanced layout of go-ipfs
+    nodes = leaves
+    while len(nodes) > 1:
+        nodes = [_parent(nodes[i:i + MAX_LINKS]) for i in range(0, len(nodes), MAX_LINKS)]
+    return nodes[0]
+
+
+def cid_v0(data: bytes) -> str:
+    leaves = [_leaf(data[i:i + CHUNK_SIZE], i == 0) for i in range(0, len(data), CHUNK_SIZE)] or [_leaf(b"")]
+    return b58encode(_root(leaves).multihash)
+
+
+def file_cid(path: str) -> str:
+    """CIDv0 of a file on disk, read chunk by chunk (blocking, run it in a worker thread)."""
+    leaves = []
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            leaves.append(_leaf(chunk, not leaves))
+    return b58encode(_root(leaves or [_leaf(b"")]).multihash)
@@ -0,0 +1,348 @@
+"""Drives the real bot handlers with synthetic users against stubbed Telegram, API and storage.
+
+Every user walks the whole flow: /register, /start, upload, set lyrics, set title,
+verify and the generate_music callback. Updates go through the same update processor
+and outbound rate limiter as in production, only the network is replaced.
+
+Usage:
+    python ai_music_bot/loadtest.py --users 1000 --rate 50
+    python ai_music_bot/loadtest.py --users 200 --tg-latency 0.05 --api-latency 2 --tracemalloc
+    python ai_music_bot/loadtest.py --soak 1800 --rate 20 --memprof-interval 60
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import bot
+import metrics
+from memprof import MemoryProfiler, format_report
+from webhook_harness import callback_update, command_update, update_ids
+
+FAKE_TOKEN = "123456:load-test"
+FAKE_WALLET = "0x" + "ab" * 20
+LAG_INTERVAL = 0.05  # Seconds between event-loop lag samples
+
+message_ids = itertools.count(1)
+
+
+def audio_update(user_id: int) -> dict:
+    """Builds a synthetic update for an uploaded audio file."""
+    update_id = next(update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "audio": {"file_id": f"file-{user_id}", "file_unique_id": f"unique-{user_id}", "duration": 3},
+        },
+    }
+
+
+def text_update(user_id: int, text: str) -> dict:
+    """Builds a synthetic update for a plain text reply."""
+    update_id = next(update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def user_flow(user_id: int) -> list:
+    """(step name, update) pairs of one user going from registration to a minted NFT."""
+    return [
+        ("register", command_update(user_id, "/register")),
+        ("start", command_update(user_id, "/start")),
+        ("upload", audio_update(user_id)),
+        ("set_lyrics", callback_update(user_id, "set_lyrics")),
+        ("lyrics", text_update(user_id, "La la la\nSynthetic lyrics")),
+        ("set_title", callback_update(user_id, "set_title")),
+        ("title", text_update(user_id, f"Load Song {user_id}")),
+        ("verify_data", callback_update(user_id, "verify_data")),
+        ("generate_music", callback_update(user_id, "generate_music")),
+    ]
+
+
+class StubTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally after `latency` seconds, counting calls per method."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "PurrTunes", "username": "purrtunes_load_bot"}
+        elif endpoint == "getFile":
+            file_id = params.get("file_id")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": 1024,
+                      "file_path": f"https://stub.telegram.local/file/{file_id}.oga"}
+        elif endpoint in ("sendMessage", "sendPhoto", "sendDocument", "editMessageText"):
+            chat_id = params.get("chat_id")
+            result = {
+                "message_id": params.get("message_id") or next(message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text") or params.get("caption") or "",
+            }
+        else:
+            # answerCallbackQuery, deleteWebhook, ...
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class _StubResponse:
+    def __init__(self, payload=None, content: bytes = b"", status_code: int = 200, headers: dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class StubHttp:
+    """Stands in for the `requests` module used by the bot: file downloads and the FastAPI backend.
+
+    Calls block for `latency` seconds, like the real ones do in their worker thread.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.minted = itertools.count(1)
+
+    def get(self, url, timeout=None, headers=None):
+        time.sleep(self.latency)
+        if "/nft_metadata/" in url:
+            return _StubResponse({"name": "Load Song", "lyrics": "La la la", "description": "Synthetic",
+                                  "music": "ipfs://QmLoadTest", "image": ""})
+        return _StubResponse(content=b"\0" * 1024)
+
+    def post(self, url, json=None, timeout=None, headers=None):
+        time.sleep(self.latency)
+        token_id = next(self.minted)
+        return _StubResponse({
+            "transaction_hash": f"0x{token_id:064x}",
+            "block_number": token_id,
+            "block_hash": f"0x{token_id:064x}",
+            "contract_address": FAKE_WALLET,
+            "token_id": token_id,
+            "gas_used": 21000,
+        })
+
+
+def install_stubs(api_latency: float, ipfs_latency: float) -> None:
+    """Points the bot's API, IPFS and registration lookups at local stubs."""
+
+    def upload_to_ipfs(file_path):
+        time.sleep(ipfs_latency)
+        # Pinned under the CID the bot computed, like Pinata does
+        return f"ipfs://{bot.file_cid(file_path)}"
+
+    bot.requests = bot.nft_cache.http = StubHttp(api_latency)
+    bot.upload_to_ipfs = upload_to_ipfs
+    bot.get_user_data = lambda user_id: {"user_id": user_id, "wallet_address": FAKE_WALLET}
+
+
+async def sample_loop_lag(lags: list, stop: asyncio.Event) -> None:
+    """Measures how late the event loop wakes a task that asked to sleep `LAG_INTERVAL`."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(loop.time() - start - LAG_INTERVAL)
+
+
+async def run_user(app, user_id: int, think_time: float, latencies: dict) -> None:
+    for step, data in user_flow(user_id):
+        update = Update.de_json(data, app.bot)
+        done = asyncio.Event()
+
+        async def handle(update=update):
+            try:
+                await app.process_update(update)
+            finally:
+                done.set()
+
+        start = time.perf_counter()
+        # Returns once the update is queued for the user, the handler sets `done`
+        await app.update_processor.process_update(update, handle())
+        await done.wait()
+        latencies[step].append(time.perf_counter() - start)
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+def percentiles(samples: list) -> str:
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+    return f"p50={pick(50):8.1f}ms p95={pick(95):8.1f}ms p99={pick(99):8.1f}ms max={ordered[-1] * 1000:8.1f}ms"
+
+
+def report(latencies: dict, lags: list, elapsed: float, users: int, telegram: StubTelegramRequest) -> None:
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"\n{users} users, {total} updates in {elapsed:.2f}s ({total / elapsed:.1f} updates/s)\n")
+
+    print("Handler latency (submit to handler done, includes per-user queueing and outbound throttling):")
+    for step, _ in user_flow(0):
+        if latencies.get(step):
+            print(f"  {step:<15} n={len(latencies[step]):<6} {percentiles(latencies[step])}")
+
+    if lags:
+        print(f"\nEvent-loop lag: {percentiles(lags)}")
+    for offender in bot.loop_watchdog.worst():
+        print(f"  blocked {offender['count']}x, {offender['total_seconds']}s total "
+              f"(max {offender['max_seconds']}s) at {offender['site']}")
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak_mib = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    print(f"Peak RSS: {peak_mib:.1f} MiB")
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"Python heap: current {current / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB")
+
+    print(f"\nBot API calls: {dict(telegram.calls)}")
+    print(f"Sessions: {bot.user_metadata.stats()}")
+    snapshot = metrics.snapshot()
+    for name in ("bot.dispatch.queue_wait_seconds", "bot.dispatch.dropped_updates",
+                 "bot.outbound.queue_wait_seconds", "bot.outbound.coalesced_edits"):
+        if name in snapshot:
+            print(f"{name}: {snapshot[name]}")
+
+
+async def arrive(app, users: int, rate: float, think_time: float, latencies: dict) -> int:
+    """Users arrive at `rate` per second, each then walks its flow at its own pace."""
+    tasks = []
+    for i in range(users):
+        tasks.append(asyncio.create_task(run_user(app, 10_000_000 + i, think_time, latencies)))
+        if rate:
+            await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    return users
+
+
+async def soak(app, seconds: float, rate: float, think_time: float, latencies: dict,
+               memory: MemoryProfiler, interval: float, top: int) -> int:
+    """New users keep arriving at `rate` for `seconds`; every `interval` the sites that grew the heap are printed."""
+    tasks = set()
+    user_ids = itertools.count(10_000_000)
+    users = 0
+    start = time.perf_counter()
+    next_report = start + interval
+    while time.perf_counter() - start < seconds:
+        task = asyncio.create_task(run_user(app, next(user_ids), think_time, latencies))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        users += 1
+        await asyncio.sleep(1 / rate)
+
+        if time.perf_counter() >= next_report:
+            next_report += interval
+            print(f"\n[{time.perf_counter() - start:.0f}s, {users} users, {len(tasks)} in flight] "
+                  f"Sessions: {bot.user_metadata.stats()}")
+            print(format_report(await asyncio.to_thread(memory.diff, top)), flush=True)
+    await asyncio.gather(*tasks)
+    return users
+
+
+async def main(users: int, rate: float, think_time: float, tg_latency: float,
+               soak_seconds: float = 0, memory: MemoryProfiler = None, memprof_interval: float = 60,
+               memprof_top: int = 10) -> None:
+    telegram = StubTelegramRequest(tg_latency)
+    app = bot.build_application(token=FAKE_TOKEN, request=telegram)
+
+    latencies = defaultdict(list)
+    lags = []
+    stop = asyncio.Event()
+
+    async with app:
+        sampler = asyncio.create_task(sample_loop_lag(lags, stop))
+        bot.loop_watchdog.start()
+        if memory is not None:
+            memory.start()
+        start = time.perf_counter()
+
+        if soak_seconds:
+            users = await soak(app, soak_seconds, rate, think_time, latencies, memory, memprof_interval, memprof_top)
+        else:
+            users = await arrive(app, users, rate, think_time, latencies)
+
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        bot.loop_watchdog.stop()
+
+    if memory is not None:
+        print("\nHeap growth over the whole run:")
+        print(format_report(memory.diff(memprof_top)))
+    report(latencies, lags, elapsed, users, telegram)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20, help="New users per second (0 starts all at once)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a user waits between steps")
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="Seconds per stubbed Bot API call")
+    parser.add_argument("--api-latency", type=float, default=0.5, help="Seconds per stubbed FastAPI/download call")
+    parser.add_argument("--ipfs-latency", type=float, default=0.3, help="Seconds per stubbed IPFS upload")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track the Python heap peak (slows the run)")
+    parser.add_argument("--soak", type=float, default=0,
+                        help="Keep users arriving at --rate for this many seconds instead of running --users")
+    parser.add_argument("--memprof-interval", type=float, default=60,
+                        help="Seconds between heap growth reports in soak mode")
+    parser.add_argument("--memprof-top", type=int, default=10, help="Allocation sites per heap report")
+    args = parser.parse_args()
+    if args.soak and not args.rate:
+        parser.error("--soak needs a --rate above 0")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Soak runs trace the heap; this file's own bookkeeping (latency samples) is left out of the reports
+    memory = MemoryProfiler(ignore=(os.path.abspath(__file__),)) if args.soak else None
+    if args.tracemalloc and memory is None:
+        tracemalloc.start()
+    install_stubs(args.api_latency, args.ipfs_latency)
+    asyncio.run(main(args.users, args.rate, args.think_time, args.tg_latency,
+                     args.soak, memory, args.memprof_interval, args.memprof_top))
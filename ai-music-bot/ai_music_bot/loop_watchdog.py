@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Event-loop blocking detector, shared by the bot and the API
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "1") == "1"
+LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))  # Seconds between heartbeats on the loop
+BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))  # Seconds the loop may be held before reporting
+MAX_OFFENDERS = 50
+STACK_DEPTH = 15
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _location(frame) -> str:
+    path = os.path.abspath(frame.f_code.co_filename)
+    if path.startswith(APP_DIR + os.sep):
+        path = os.path.relpath(path, APP_DIR)
+    return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+def blocking_site(frame) -> str:
+    """Innermost frame of our own code, where a blocking call was made (else the innermost frame)."""
+    leaf = frame
+    while frame is not None:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if path.startswith(APP_DIR + os.sep) and path != os.path.abspath(__file__):
+            return _location(frame)
+        frame = frame.f_back
+    return _location(leaf)
+
+
+class _Offender:
+    __slots__ = ("site", "count", "total", "max", "stack")
+
+    def __init__(self, site: str, stack: list):
+        self.site = site
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.stack = stack
+
+    def snapshot(self) -> dict:
+        return {"site": self.site, "count": self.count, "total_seconds": round(self.total, 3),
+                "max_seconds": round(self.max, 3), "stack": self.stack}
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and reports the code holding the loop longer than `threshold`.
+
+    A heartbeat task on the loop stamps the time every `interval` seconds and records how
+    late it woke up (into `lag_histogram`, if given). A watchdog thread checks the stamp and,
+    when it's older than `threshold`, captures the loop thread's stack right there. Stalls
+    are grouped by the innermost frame of our own code; the worst ones are in `snapshot()`.
+    """
+
+    def __init__(self, lag_histogram=None, interval: float = LAG_INTERVAL, threshold: float = BLOCK_THRESHOLD):
+        self.lag_histogram = lag_histogram
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self._offenders = {}
+        self._lock = threading.Lock()
+        self._beat = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        """Starts watching the running loop, call it from the loop thread."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event-loop watchdog started (threshold {self.threshold * 1000:.0f}ms).")
+
+    def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if self.lag_histogram is not None:
+                self.lag_histogram.observe(max(lag, 0.0))
+            self._beat = time.monotonic()
+
+    def _watch(self) -> None:
+        stalled_beat, stall = None, None  # Heartbeat stamp the current stall started from, and its site/stack
+        while not self._stop_event.wait(self.interval / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+
+            if stall is not None and beat != stalled_beat:
+                # The loop got going again: `beat` is roughly when the blocking callback returned
+                self._record(*stall, beat - stalled_beat - self.interval)
+                stalled_beat, stall = None, None
+
+            if stall is None and blocked > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stack = traceback.format_stack(frame, limit=STACK_DEPTH)
+                stalled_beat, stall = beat, (blocking_site(frame), stack)
+                logger.warning(f"Event loop blocked for over {self.threshold * 1000:.0f}ms at {stall[0]}:\n"
+                               f"{''.join(stack)}")
+
+    def _record(self, site: str, stack: list, seconds: float) -> None:
+        with self._lock:
+            self.stalls += 1
+            self.blocked_seconds += seconds
+            offender = self._offenders.get(site)
+            if offender is None:
+                if len(self._offenders) >= MAX_OFFENDERS:
+                    # Make room by dropping the least harmful site
+                    del self._offenders[min(self._offenders.values(), key=lambda o: o.total).site]
+                offender = self._offenders[site] = _Offender(site, [line.rstrip() for line in stack])
+            offender.count += 1
+            offender.total += seconds
+            offender.max = max(offender.max, seconds)
+        logger.warning(f"Event loop was blocked for {seconds * 1000:.0f}ms at {site}.")
+
+    def worst(self, limit: int = 5) -> list:
+        with self._lock:
+            offenders = sorted(self._offenders.values(), key=lambda o: o.total, reverse=True)[:limit]
+            return [offender.snapshot() for offender in offenders]
+
+    def snapshot(self) -> dict:
+        return {
+            "stalls": self.stalls,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "threshold_seconds": self.threshold,
+            "worst": self.worst(),
+        }
@@ -1,17 +1,35 @@
 import subprocess
 import json
 import asyncio
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 import logging
-import requests
 from dotenv import load_dotenv
 import os
 import re
+from dataclasses import asdict
 from datetime import datetime
 import base64
-from .utils import get_nft_metadata_from_contract, sanitize_data, restore_data
+import hashlib
+import hmac
+from .utils import sanitize_data, restore_data
+from .chain import get_nft_metadata_fields, get_nft_metadata_from_contract
+from .rpc_pool import is_endpoint_error, rpc_pool
+from .contract_build import PROJECT_DIR, ensure_contract_wasm, prebuild
+from .subprocesses import executor
+from .search_index import SearchIndex, SongDocument
+from .signers import Signer, signer_pool
+from .pin_gate import pin_gate
+from .idempotency import IdempotencyConflict, IdempotencyStore
+from . import metrics
+from .sessions import RegisteredUser, SessionStore
+from .profiling import ProfilingMiddleware, profiler
+from .memprof import format_report, memory_profiler
+from .loop_watchdog import LOOP_WATCHDOG, LoopWatchdog
+from .warmup import WARMUP, preload
 
 load_dotenv()
 
@@ -32,6 +50,10 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE)
     allow_headers=["*"],  # Allow all headers
 )
+# Only costs a path check per request unless a route is being profiled
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+# Metadata carries the whole Base64 SVG and the lyrics, which compress well
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")))
 
 # Logger setup
 logging.basicConfig(level=logging.INFO)
@@ -47,6 +69,15 @@ class MusicRequest(BaseModel):
     meta: str
     music_data: str
     svg_template: str
+    # CID the client computed for `music_data` and is still pinning; the mint deploys meanwhile
+    # and waits for its /confirm_pin before writing the URI on chain
+    pending_cid: str | None = None
+
+
+class PinConfirmation(BaseModel):
+    cid: str  # The locally computed CID sent as `pending_cid`
+    pinned_cid: str | None = None  # What the pinning service returned
+    error: str | None = None
 
 
 class MusicNFTResponse(BaseModel):
@@ -56,46 +87,130 @@ class MusicNFTResponse(BaseModel):
     contract_address: str
     deployed_at: str
     gas_used: int
+    token_id: int = 1
+    signer_address: str | None = None  # Deployer key that sent the transactions
 
 
-# Function to deploy the contract and get the contract address
-async def deploy_contract() -> str:
-    try:
-        project_dir = os.path.join(os.getcwd(), "purrtunes_contract")
-        # Run the cargo deploy command asynchronously
-        process = await asyncio.create_subprocess_exec(
-            "cargo", "stylus", "deploy",
-            f"--endpoint={os.getenv('RPC_URL', 'http://localhost:8547')}",
-            f"--private-key={os.getenv('PRIVATE_KEY')}",
-            cwd=project_dir,  # Running from contract directory, because Cargo.toml resides there
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+# Collection mode: mint every song as a token of one shared contract instead of deploying per song
+COLLECTION_ADDRESS = os.getenv("COLLECTION_ADDRESS")
+COLLECTION_MODE = os.getenv("COLLECTION_MODE", "1" if COLLECTION_ADDRESS else "0") == "1"
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Required in the X-Admin-Token header of /admin endpoints
+PIN_CONFIRM_SECRET = os.getenv("PIN_CONFIRM_SECRET")  # Shared with the bot, sent in the X-Pin-Secret header
+
+
+def require_admin(x_admin_token: str | None = Header(None)) -> None:
+    # Admin endpoints are disabled altogether while ADMIN_TOKEN isn't set
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+def require_pin_secret(x_pin_secret: str | None = Header(None)) -> None:
+    # Only the client pinning the audio may confirm it, /confirm_pin is disabled while the secret isn't set
+    if not PIN_CONFIRM_SECRET or not x_pin_secret or not hmac.compare_digest(x_pin_secret, PIN_CONFIRM_SECRET):
+        raise HTTPException(status_code=403, detail="Pin confirmation secret required.")
+
+
+# Build the contract WASM once in the background, so the first mint doesn't pay for it
+@app.on_event("startup")
+async def prebuild_contract():
+    if os.getenv("CONTRACT_PREBUILD", "1") == "1":
+        app.state.prebuild_task = asyncio.create_task(prebuild())
+
+
+# Heavy modules load on first use; with WARMUP=1 they're imported in the background once the API is up
+@app.on_event("startup")
+async def warm_up_imports():
+    if WARMUP:
+        app.state.warmup_task = asyncio.create_task(preload("eth_abi", "requests"))
+
+
+# Probe the RPC nodes in the background so reads go to the fastest healthy one
+@app.on_event("startup")
+async def start_rpc_pool():
+    rpc_pool.start()
 
-        # Timeout settings
-        timeout = 300  # Max wait time in seconds
-        start_time = asyncio.get_event_loop().time()
 
-        while True:
-            if process.returncode is not None:
-                break  # Process finished
-            if asyncio.get_event_loop().time() - start_time > timeout:
-                process.kill()
-                raise TimeoutError("Contract deployment timed out.")
+@app.on_event("shutdown")
+async def stop_rpc_pool():
+    rpc_pool.stop()
+
+
+# Resolve the signer addresses and keep an eye on their balances
+@app.on_event("startup")
+async def start_signer_pool():
+    await signer_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_signer_pool():
+    signer_pool.stop()
+
+
+# Reports callbacks that hold the event loop (blocking I/O, CPU-heavy work) with their stack
+loop_watchdog = LoopWatchdog(metrics.histogram("api.loop.lag_seconds"))
+metrics.gauge("api.loop.blocked", loop_watchdog.snapshot)
+
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    if LOOP_WATCHDOG:
+        loop_watchdog.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_watchdog():
+    loop_watchdog.stop()
+
+
+# Function to deploy the contract and get the contract address, with the nonce it was created at
+async def deploy_contract(signer: Signer) -> tuple[str, int]:
+    try:
+        # Reuse the prebuilt artifact instead of recompiling on every deploy
+        wasm_path = await ensure_contract_wasm()
+
+        # Deploys are sends too, so they stay on the node the signer's nonce sequence is pinned to
+        rpc_url = rpc_pool.send_url(signer.address)
+
+        # Run the cargo deploy command, at most SUBPROCESS_DEPLOY_LIMIT at once and within DEPLOY_TIMEOUT
+        async with executor.slot("deploy") as slot:
+            # The deploy is the signer's next transaction; the contract checks this nonce on initialization.
+            # The caller holds the signer, so nothing else sends from it in between
+            with rpc_pool.track(rpc_url):
+                nonce_result = await slot.run("cast", "nonce", signer.address, "--block", "pending", "--rpc-url", rpc_url)
+                if nonce_result.returncode != 0 and is_endpoint_error(nonce_result.stderr):
+                    raise ConnectionError(f"Nonce of {signer.address} via {rpc_url} failed: {nonce_result.stderr}")
+            if nonce_result.returncode != 0:
+                raise RuntimeError(f"Nonce of {signer.address} failed: {nonce_result.stderr}")
+            deploy_nonce = int(nonce_result.stdout.strip())
+
+            # Deploying and activating takes far longer than a round trip, so it's not timed against the node
+            with rpc_pool.track(rpc_url, latency=False):
+                result = await slot.run(
+                    "cargo", "stylus", "deploy",
+                    f"--endpoint={rpc_url}",
+                    f"--private-key={signer.key}",
+                    f"--wasm-file={wasm_path}",
+                    cwd=PROJECT_DIR  # Running from contract directory, because Cargo.toml resides there
+                )
+                # Raised inside track() so a node that didn't answer counts against it
+                if result.returncode != 0 and is_endpoint_error(result.stderr):
+                    raise ConnectionError(f"Deploy via {rpc_url} failed: {result.stderr}")
 
-            await asyncio.sleep(5)  # Check every 5 seconds
+        # Reverts, nonce or balance problems: the node answered
+        if result.returncode != 0:
+            raise RuntimeError(f"Deploy failed: {result.stderr}")
 
-        # Capture the output after deployment
-        stdout, stderr = await process.communicate()
-        output = stdout.decode() + stderr.decode()
+        output = result.stdout + result.stderr
         logger.info(f"Deploy command output: {output}")
 
         # Extract the contract address from the output
         for line in output.splitlines():
             if "deployed code at address:" in line:
                 contract_address = line.split(":")[1].strip()
-                logger.info(f"Contract deployed at: {contract_address}")
-                return contract_address
+                logger.info(f"Contract deployed at: {contract_address} (nonce {deploy_nonce})")
+                return contract_address, deploy_nonce
 
         raise ValueError("Contract address not found in deployment output.")
 
@@ -104,6 +219,22 @@ async def deploy_contract() -> str:
         raise e
 
 
+def clean_address(address: str) -> str:
+    """Strips spaces and the color formatting `cargo stylus` wraps addresses in."""
+    return address.strip().replace('\x1b[38;5;183;1m', '').replace('\x1b[0;0m', '')
+
+
+def encode_metadata(lyrics: str, meta: str, svg_template: str) -> tuple[str, str, str]:
+    """Base64 encodes lyrics, meta and the SVG the way the contract stores them."""
+    # Base64 encode the SVG
+    svg_encoded = base64.b64encode(svg_template.encode()).decode()
+    # lyrics_encoded = base64.b64encode(lyrics.encode()).decode()
+    sanitized_data = sanitize_data(lyrics)
+    lyrics_encoded = base64.b64encode(sanitized_data.encode('utf-8')).decode('utf-8')
+    meta_encoded = base64.b64encode(meta.encode()).decode()
+    return lyrics_encoded, meta_encoded, svg_encoded
+
+
 # Function to initialize the contract with the provided owner address, image URL, and music URL
 async def initialize_contract(
         owner_address: str,
@@ -114,49 +245,51 @@ async def initialize_contract(
         music_data: str,
         svg_template: str,
         contract_address: str,
+        deploy_nonce: int,
+        signer: Signer,
 ):
     try:
-        contract_address = contract_address.strip()  # Remove extra spaces
-        contract_address = contract_address.replace('\x1b[38;5;183;1m', '').replace('\x1b[0;0m',
-                                                                                    '')  # Strip color formatting
+        contract_address = clean_address(contract_address)
 
-        # Base64 encode the SVG
-        svg_encoded = base64.b64encode(svg_template.encode()).decode()
-        # lyrics_encoded = base64.b64encode(lyrics.encode()).decode()
-        sanitized_data = sanitize_data(lyrics)
-        lyrics_encoded = base64.b64encode(sanitized_data.encode('utf-8')).decode('utf-8')
-        meta_encoded = base64.b64encode(meta.encode()).decode()
+        lyrics_encoded, meta_encoded, svg_encoded = encode_metadata(lyrics, meta, svg_template)
 
         # Ensure the address starts with '0x' and is valid
         if not contract_address.startswith('0x'):
             raise ValueError("Invalid contract address. Must start with '0x'.")
 
+        rpc_url = rpc_pool.send_url(signer.address)
+
         # Command components as a list of arguments
         command = [
             "cast", "send", contract_address,
-            "--rpc-url", os.getenv("RPC_URL", "http://localhost:8547"),
-            "--private-key", os.getenv("PRIVATE_KEY"),
-            "initializeContract(address,string,string,string,string,string,string)",  # Adjusted parameters
+            "--rpc-url", rpc_url,
+            "--private-key", signer.key,
+            "initializeContract(address,string,string,string,string,string,string,uint64)",  # Adjusted parameters
             owner_address,
             symbol,
             title,
             lyrics_encoded,
             meta_encoded,
             music_data,
-            svg_encoded
+            svg_encoded,
+            str(deploy_nonce)  # Proves the sender deployed the contract
         ]
 
-        print(f"\n\n\n {command} \n\n\n")
+        # Not the command itself, it holds the private key
+        logger.debug(f"initializeContract on {contract_address} from {signer.address} (nonce {deploy_nonce})")
 
-        # Run the cast send command asynchronously
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        # Run the cast send command in a send slot
+        async with executor.slot("send") as slot:
+            # `cast send` waits for the receipt, so it's not timed against the node
+            with rpc_pool.track(rpc_url, latency=False):
+                result = await slot.run(*command)
+                if result.returncode != 0 and is_endpoint_error(result.stderr):
+                    raise ConnectionError(f"initializeContract via {rpc_url} failed: {result.stderr}")
+
+        if result.returncode != 0:
+            raise RuntimeError(f"initializeContract failed: {result.stderr}")
 
-        stdout, stderr = await process.communicate()
-        output = stdout.decode() + stderr.decode()
+        output = result.stdout + result.stderr
         logger.info(f"Initialize contract command output: {output}")
 
         try:
@@ -214,31 +347,235 @@ async def initialize_contract(
         raise e
 
 
-@app.post("/generate_music")
-async def generate_music(request: MusicRequest):
-    try:
-        # Step 1: Deploy the contract asynchronously
-        contract_address = await deploy_contract()
+async def send_transaction(signer: Signer, contract_address: str, signature: str, *args: str) -> dict:
+    """Runs `cast send` from `signer` and returns the transaction receipt."""
+    rpc_url = rpc_pool.send_url(signer.address)
+    command = [
+        "cast", "send", contract_address,
+        "--rpc-url", rpc_url,
+        "--private-key", signer.key,
+        "--json",
+        signature,
+        *args
+    ]
 
-        # Step 2: Initialize the contract asynchronously
-        music_url = await initialize_contract(
-            owner_address=request.owner_address,
-            symbol=request.symbol,
+    async with executor.slot("send") as slot:
+        # `cast send` waits for the receipt, so it's not timed against the node
+        with rpc_pool.track(rpc_url, latency=False):
+            result = await slot.run(*command)
+            # Raised inside track() so a node that didn't answer counts against it, a revert or nonce error doesn't
+            if result.returncode != 0 and is_endpoint_error(result.stderr):
+                raise ConnectionError(f"{signature} via {rpc_url} failed: {result.stderr}")
+
+    if result.returncode != 0:
+        raise RuntimeError(f"{signature} failed: {result.stderr}")
+
+    receipt = json.loads(result.stdout)
+    if receipt.get("status") not in ("0x1", 1, "1"):
+        raise RuntimeError(f"{signature} reverted in {receipt.get('transactionHash')}")
+    return receipt
+
+
+_collection_lock = asyncio.Lock()
+collection_address = COLLECTION_ADDRESS
+
+
+async def get_collection_address(signer: Signer) -> str:
+    """Returns the collection contract, deploying and initializing it once if none is configured."""
+    global collection_address
+
+    async with _collection_lock:
+        if not collection_address:
+            address, deploy_nonce = await deploy_contract(signer)
+            address = clean_address(address)
+            owner = os.getenv("COLLECTION_OWNER") or signer.address
+
+            await send_transaction(signer, address, "initializeCollection(address,string,uint64)",
+                                   owner, "MUSICNFT", str(deploy_nonce))
+
+            # Every signer of the pool mints into the collection, so all of them must be minters
+            others = [s.address for s in signer_pool.signers if s.address and s.address != signer.address]
+            if owner.lower() == signer.address.lower():
+                for minter in others:
+                    await send_transaction(signer, address, "setMinter(address,bool)", minter, "true")
+            elif others:
+                logger.warning(f"Collection owner {owner} must call setMinter(address,bool) for: {', '.join(others)}")
+
+            collection_address = address
+            logger.info(f"Collection deployed at {address}, set COLLECTION_ADDRESS={address} to reuse it.")
+
+    return collection_address
+
+
+async def mint_into_collection(
+        owner_address: str,
+        title: str,
+        lyrics: str,
+        meta: str,
+        music_data: str,
+        svg_template: str,
+        signer: Signer,
+) -> MusicNFTResponse:
+    """Mints a new token with its own metadata into the collection in a single transaction."""
+    contract_address = await get_collection_address(signer)
+    lyrics_encoded, meta_encoded, svg_encoded = encode_metadata(lyrics, meta, svg_template)
+
+    receipt = await send_transaction(
+        signer,
+        contract_address,
+        "mintWithMetadata(address,string,string,string,string,string)",
+        owner_address,
+        title,
+        lyrics_encoded,
+        meta_encoded,
+        music_data,
+        svg_encoded
+    )
+    logger.info(f"Mint transaction receipt: {receipt.get('transactionHash')}")
+
+    # The new token id is the third indexed topic of the Transfer event
+    for log in receipt.get("logs", []):
+        topics = log.get("topics", [])
+        if len(topics) == 4 and topics[0] == TRANSFER_TOPIC:
+            token_id = int(topics[3], 16)
+            break
+    else:
+        raise ValueError("Transfer event not found in mint receipt.")
+
+    return MusicNFTResponse(
+        transaction_hash=receipt["transactionHash"],
+        block_number=int(receipt["blockNumber"], 16),
+        block_hash=receipt["blockHash"],
+        deployed_at=str(datetime.now()),
+        contract_address=contract_address,
+        gas_used=int(receipt["gasUsed"], 16),
+        token_id=token_id
+    )
+
+
+# Mint jobs by idempotency key, so a retried request doesn't deploy a second contract
+mint_jobs = IdempotencyStore()
+
+
+def mint_fingerprint(request: MusicRequest) -> str:
+    """Hash of what a mint writes on chain, so a reused key with edited metadata is refused."""
+    # The SVG is redrawn (randomly) on every attempt, so it's left out
+    fields = request.model_dump(exclude={"svg_template"})
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+# Full-text index of minted songs, fed at mint time (persisted to SEARCH_INDEX_PATH if set)
+search_index = SearchIndex()
+metrics.gauge("api.search.documents", lambda: len(search_index))
+search_latency = metrics.histogram("api.search.query_seconds")
+
+
+@app.on_event("startup")
+async def load_search_index():
+    search_index.load()
+
+
+async def mint_music_nft(request: MusicRequest) -> MusicNFTResponse:
+    response = await mint_song(request)
+
+    # The song is minted at this point: an index failure must not fail the job, or a retry would mint again
+    try:
+        document = SongDocument(
+            contract_address=clean_address(response.contract_address),
+            token_id=response.token_id,
             title=request.title,
             lyrics=request.lyrics,
-            meta=request.meta,
-            music_data=request.music_data,
-            svg_template=request.svg_template,
-            contract_address=contract_address
+            description=request.meta,
+            owner_address=request.owner_address,
+            music=request.music_data
         )
+        # Indexed on the loop, where searches run; only the file append goes to a thread
+        search_index.add(document)
+        await asyncio.to_thread(search_index.persist, document)
+    except Exception as e:
+        logger.error(f"Indexing {response.contract_address} (token {response.token_id}) failed: {e}")
+    return response
+
+
+async def mint_song(request: MusicRequest) -> MusicNFTResponse:
+    if request.pending_cid and request.pending_cid not in request.music_data:
+        raise ValueError(f"music_data doesn't point at the pending CID {request.pending_cid}.")
+    if request.pending_cid and not PIN_CONFIRM_SECRET:
+        raise ValueError("Minting with a pending_cid needs PIN_CONFIRM_SECRET set, nothing could confirm the pin.")
+
+    if COLLECTION_MODE:
+        # Nothing to overlap the pin with, so it's waited for before taking a signer
+        await wait_for_pin(request)
+        async with signer_pool.acquire() as signer:
+            # One transaction into the existing collection, no deployment
+            response = await mint_into_collection(
+                owner_address=request.owner_address,
+                title=request.title,
+                lyrics=request.lyrics,
+                meta=request.meta,
+                music_data=request.music_data,
+                svg_template=request.svg_template,
+                signer=signer
+            )
+    else:
+        # Step 1: Deploy the contract, other mints proceed in parallel on the other signers
+        async with signer_pool.acquire() as signer:
+            contract_address, deploy_nonce = await deploy_contract(signer)
+
+        # The deploy doesn't need the audio, so it ran while the client was pinning it.
+        # The signer serves other mints meanwhile, then initializes the contract it deployed
+        try:
+            await wait_for_pin(request)
+        except Exception as e:
+            logger.error(f"Contract {clean_address(contract_address)} left uninitialized: {e}")
+            raise
+
+        # Step 2: Initialize the contract, only its deployer may
+        async with signer_pool.acquire(signer):
+            response = await initialize_contract(
+                owner_address=request.owner_address,
+                symbol=request.symbol,
+                title=request.title,
+                lyrics=request.lyrics,
+                meta=request.meta,
+                music_data=request.music_data,
+                svg_template=request.svg_template,
+                contract_address=contract_address,
+                deploy_nonce=deploy_nonce,
+                signer=signer
+            )
+
+    response.signer_address = signer.address
+    logger.info(f"Minted {response.contract_address} (token {response.token_id}) with signer {signer.name}")
+    return response
+
+
+async def wait_for_pin(request: MusicRequest) -> None:
+    """Blocks until the audio of `request` is confirmed pinned, if the client was still uploading it."""
+    if request.pending_cid:
+        await pin_gate.wait(request.pending_cid)
+
 
-        return music_url
+@app.post("/generate_music")
+async def generate_music(request: MusicRequest, idempotency_key: str | None = Header(None)):
+    try:
+        if idempotency_key:
+            return await mint_jobs.run(idempotency_key, lambda: mint_music_nft(request), mint_fingerprint(request))
+        return await mint_music_nft(request)
 
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating music: {e}")
         return {"error": str(e)}
 
 
+@app.post("/confirm_pin", dependencies=[Depends(require_pin_secret)])
+async def confirm_pin(confirmation: PinConfirmation):
+    """Called by the client once the upload of a `pending_cid` finished, successfully or not."""
+    status = pin_gate.confirm(confirmation.cid, confirmation.pinned_cid, confirmation.error)
+    return {"cid": confirmation.cid, "status": status}
+
+
 # A mock database to store linked wallets
 linked_wallets = {}
 
@@ -253,8 +590,10 @@ class AddUserRequest(BaseModel):
     chain_type: str
 
 
-# In-memory session to hold user data temporarily (in production, use a real database)
-user_metadata = {}
+# In-memory session to hold user data temporarily (in production, use a real database),
+# bounded by SESSION_MAX_USERS and SESSION_TTL
+user_metadata = SessionStore()
+metrics.gauge("api.sessions", user_metadata.stats)
 
 
 @app.post("/add_user")
@@ -267,13 +606,12 @@ async def add_user(request: AddUserRequest):
     chain_type = request.chain_type
 
     # Store the user data in a temporary session (use a database in production)
-    user_metadata[user_id_tg] = {
-        "email": email,
-        "user_id": user_id,
-        "wallet_address": wallet_address,
-        "chain_type": chain_type,
-        "status": "registered"
-    }
+    user_metadata[user_id_tg] = RegisteredUser(
+        email=email,
+        user_id=user_id,
+        wallet_address=wallet_address,
+        chain_type=chain_type
+    )
 
     logger.info(f"User {email} with ID {user_id} and wallet {wallet_address} added.")
 
@@ -286,16 +624,150 @@ async def get_user(user_id: str):
     """Retrieve user data from the session."""
     user_data = user_metadata.get(user_id)
     if user_data:
-        return user_data
+        return asdict(user_data)
+    elif user_metadata.expired(user_id):
+        return {"status": "error", "message": "⌛ Your registration has expired. Please /register again."}
     else:
         return {"status": "error", "message": "User data not found."}
 
 
+def metadata_etag(contract_address: str, token_id: int, metadata: dict) -> str:
+    """Weak ETag of a metadata response: the token plus a hash of its content.
+
+    Weak because the gzip and identity encodings of the response share it.
+    """
+    digest = hashlib.sha256(json.dumps(metadata, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+    return f'W/"{contract_address.lower()}-{token_id}-{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored on both sides
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
 # FastAPI route to get NFT metadata
 @app.get("/nft_metadata/{contract_address}")
-async def get_nft_metadata(contract_address: str):
-    """Endpoint to fetch NFT metadata from the blockchain."""
-    return await get_nft_metadata_from_contract(contract_address)
+async def get_nft_metadata(contract_address: str, token_id: int = 1, fields: str | None = None,
+                           if_none_match: str | None = Header(None)):
+    """Endpoint to fetch NFT metadata from the blockchain.
+
+    `fields` (e.g. `name,music`) reads only those fields; the artwork is skipped unless `image` is asked for.
+    Responses carry an ETag, a matching If-None-Match gets an empty 304.
+    """
+    if fields:
+        selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+        metadata = await get_nft_metadata_fields(contract_address, token_id, selected)
+    else:
+        metadata = await get_nft_metadata_from_contract(contract_address, token_id)
+
+    # The metadata can change (updateSvgTemplate), so clients revalidate instead of caching blindly
+    headers = {"ETag": metadata_etag(contract_address, token_id, metadata), "Cache-Control": "no-cache",
+               "Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(metadata, headers=headers)
+
+
+@app.get("/search")
+async def search(q: str, limit: int = 10):
+    """Minted songs whose title, lyrics or description match `q`, best first."""
+    with search_latency.time():
+        results = search_index.search(q, min(max(limit, 1), 50))
+    return {"query": q, "results": results}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process counters and latency histograms."""
+    return metrics.snapshot()
+
+
+@app.post("/admin/profile/start", dependencies=[Depends(require_admin)])
+async def start_profile(mode: str = "sample", seconds: float | None = None, route: str | None = None,
+                        count: int | None = None):
+    """Profiles the API for `seconds`, or for the next `count` requests to `route`."""
+    try:
+        profiler.start(mode=mode, seconds=seconds, route=route, requests=count)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.status()
+
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    profiler.stop()
+    return profiler.status()
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(format: str | None = None, sort: str = "cumulative"):
+    """Status of the profiler, or the last result as `collapsed` stacks, `pstats` text or a `prof` file."""
+    if format is None:
+        return profiler.status()
+
+    result = profiler.last_result
+    if result is None:
+        raise HTTPException(status_code=404, detail="No profile recorded yet.")
+    try:
+        if format == "collapsed":
+            return PlainTextResponse(result.collapsed())
+        if format == "pstats":
+            return PlainTextResponse(result.pstats_text(sort))
+        if format == "prof":
+            return Response(result.prof_bytes(), media_type="application/octet-stream",
+                            headers={"Content-Disposition": 'attachment; filename="api.prof"'})
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    raise HTTPException(status_code=400, detail="format must be one of: collapsed, pstats, prof.")
+
+
+@app.post("/admin/memory/start", dependencies=[Depends(require_admin)])
+async def start_memory_profile():
+    """Turns tracemalloc on and takes the baseline snapshot."""
+    try:
+        await asyncio.to_thread(memory_profiler.start)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return memory_profiler.status()
+
+
+@app.post("/admin/memory/baseline", dependencies=[Depends(require_admin)])
+async def reset_memory_baseline():
+    try:
+        await asyncio.to_thread(memory_profiler.baseline)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return memory_profiler.status()
+
+
+@app.post("/admin/memory/stop", dependencies=[Depends(require_admin)])
+async def stop_memory_profile():
+    memory_profiler.stop()
+    return memory_profiler.status()
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def get_memory_profile(view: str | None = None, group_by: str = "lineno", limit: int = 25,
+                             format: str = "json"):
+    """Status of the memory profiler, or the `top` live allocation sites / their `diff` against the baseline."""
+    if view is None:
+        return memory_profiler.status()
+    if view not in ("top", "diff"):
+        raise HTTPException(status_code=400, detail="view must be one of: top, diff.")
+
+    try:
+        # Snapshots take a while on a big heap, the worker thread keeps the loop turning meanwhile
+        report = await asyncio.to_thread(memory_profiler.top if view == "top" else memory_profiler.diff, limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PlainTextResponse(format_report(report)) if format == "text" else report
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import logging
+import os
+import time
+import tracemalloc
+
+# On-demand heap profiler (tracemalloc snapshots and diffs), shared by the bot and the API
+logger = logging.getLogger(__name__)
+
+TRACE_FRAMES = int(os.getenv("MEMPROF_FRAMES", "1"))  # Frames kept per allocation, 1 is enough to group by line
+GROUP_BY = ("lineno", "filename")
+
+
+def _site(frame, group_by: str) -> str:
+    # Last two path components are enough to tell modules apart
+    path = "/".join(frame.filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return path if group_by == "filename" else f"{path}:{frame.lineno}"
+
+
+def rss_bytes() -> int | None:
+    """Current resident set size, None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _check_grouping(group_by: str) -> None:
+    if group_by not in GROUP_BY:
+        raise ValueError(f"Unknown grouping {group_by!r}, expected one of {GROUP_BY}.")
+
+
+class MemoryProfiler:
+    """Takes tracemalloc snapshots on demand and diffs them against a baseline, grouped by file and line.
+
+    Tracing stays off until `start()`, since every allocation is slower and bigger while it runs.
+    The baseline is the snapshot taken at start (or at the last `baseline()`), so a diff shows
+    what was allocated and not freed since then. Allocations made from files in `ignore` (by tracemalloc
+    itself and by imports) are left out of the reports.
+    """
+
+    def __init__(self, frames: int = TRACE_FRAMES, ignore: tuple = ()):
+        self.frames = frames
+        # Module code loaded by imports isn't what we're after either
+        self.filters = [tracemalloc.Filter(False, path) for path in
+                        (tracemalloc.__file__, "<frozen importlib._bootstrap>",
+                         "<frozen importlib._bootstrap_external>", "<unknown>", *ignore)]
+        self._baseline = None
+        self._baseline_at = None
+        self._started_tracing = False  # Tracing started elsewhere (e.g. PYTHONTRACEMALLOC) is left running
+
+    @property
+    def active(self) -> bool:
+        return self._baseline is not None
+
+    def start(self) -> None:
+        if self._baseline is not None:
+            raise RuntimeError("Memory profiling is already running.")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self.baseline()
+        logger.info("Memory profiling started.")
+
+    def stop(self) -> None:
+        if self._baseline is None:
+            return
+        self._baseline = self._baseline_at = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        logger.info("Memory profiling stopped.")
+
+    def baseline(self) -> None:
+        """Makes the current heap the reference of later diffs."""
+        self._baseline = self._snapshot()
+        self._baseline_at = time.time()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        # Takes up to a few hundred ms on a big heap, so async callers run it in a worker thread
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory profiling isn't running, start it first.")
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        return {
+            "active": self.active,
+            "baseline_age_seconds": round(time.time() - self._baseline_at, 1) if self.active else None,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "rss_bytes": rss_bytes(),
+        }
+
+    def top(self, limit: int = 25, group_by: str = "lineno") -> dict:
+        """Biggest live allocation sites right now."""
+        _check_grouping(group_by)
+        stats = self._snapshot().statistics(group_by)
+        return self._report("top", group_by, stats[:limit])
+
+    def diff(self, limit: int = 25, group_by: str = "lineno", rebaseline: bool = False) -> dict:
+        """Allocation sites that grew (or shrank) the most since the baseline."""
+        _check_grouping(group_by)
+        if self._baseline is None:
+            raise RuntimeError("Memory profiling isn't running, start it first.")
+        snapshot = self._snapshot()
+        # Sorted by the absolute size change
+        report = self._report("diff", group_by, snapshot.compare_to(self._baseline, group_by)[:limit])
+        if rebaseline:
+            self._baseline, self._baseline_at = snapshot, time.time()
+        return report
+
+    def _report(self, view: str, group_by: str, stats: list) -> dict:
+        return {**self.status(), "view": view, "group_by": group_by,
+                "sites": [self._site_stats(stat, group_by) for stat in stats]}
+
+    @staticmethod
+    def _site_stats(stat, group_by: str) -> dict:
+        site = {"site": _site(stat.traceback[0], group_by), "size_bytes": stat.size, "count": stat.count}
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            site.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+        return site
+
+
+def format_report(report: dict) -> str:
+    """Plain-text table of a `top()` or `diff()` report, for logs and chat replies."""
+    mib = lambda size: f"{size / 2 ** 20:.1f} MiB" if size is not None else "n/a"
+    lines = [f"Traced {mib(report['traced_bytes'])} (peak {mib(report['traced_peak_bytes'])}), "
+             f"RSS {mib(report['rss_bytes'])}"]
+    if report["view"] == "diff":
+        lines.append(f"Change since the baseline of {report['baseline_age_seconds']:g}s ago, by {report['group_by']}:")
+        for site in report["sites"]:
+            lines.append(f"  {site['size_diff_bytes'] / 1024:+10.1f} KiB {site['count_diff']:+8d} blocks "
+                         f"{site['size_bytes'] / 1024:10.1f} KiB  {site['site']}")
+    else:
+        lines.append(f"Live allocations by {report['group_by']}:")
+        for site in report["sites"]:
+            lines.append(f"  {site['size_bytes'] / 1024:10.1f} KiB {site['count']:8d} blocks  {site['site']}")
+    return "\n".join(lines)
+
+
+memory_profiler = MemoryProfiler()
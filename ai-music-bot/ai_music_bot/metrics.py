@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import deque
+
+# In-process metrics registry, shared by the bot and the API
+_lock = threading.Lock()
+_metrics = {}
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge:
+    """Value that can go up and down, or be computed on read."""
+
+    def __init__(self, func=None):
+        self.value = 0
+        self.func = func
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def snapshot(self) -> dict:
+        return {"value": self.func() if self.func else self.value}
+
+
+class Histogram:
+    """Keeps count/sum/max plus a window of recent samples for percentiles."""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def time(self):
+        """Context manager observing the elapsed seconds of its block."""
+        return _Timer(self)
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def _get_or_create(name: str, cls, *args):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(*args)
+        return metric
+
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+
+def gauge(name: str, func=None) -> Gauge:
+    return _get_or_create(name, Gauge, func)
+
+
+def histogram(name: str) -> Histogram:
+    return _get_or_create(name, Histogram)
+
+
+def snapshot() -> dict:
+    """Returns the current value of every registered metric."""
+    with _lock:
+        items = list(_metrics.items())
+    return {name: metric.snapshot() for name, metric in sorted(items)}
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PIN_CONFIRM_TIMEOUT = float(os.getenv("PIN_CONFIRM_TIMEOUT", "120"))  # Seconds a mint waits for its pin
+PIN_GATE_TTL = float(os.getenv("PIN_GATE_TTL", "3600"))  # Seconds a confirmation is kept for (retried) mints
+PIN_GATE_MAX_ENTRIES = int(os.getenv("PIN_GATE_MAX_ENTRIES", "10000"))
+
+pin_wait = metrics.histogram("api.pins.wait_seconds")
+mismatches = metrics.counter("api.pins.mismatched")
+failures = metrics.counter("api.pins.failed")
+
+
+class PinError(RuntimeError):
+    """The audio wasn't pinned under the CID the mint is about to write on chain."""
+
+
+class PinGate:
+    """Holds mints back until the client confirms their audio is pinned under the CID it computed locally.
+
+    The client computes the CID, then uploads the audio while the mint deploys; only the
+    transaction writing the `ipfs://` URI waits here. A confirmation may arrive before or
+    after the mint asks for it. A confirmed pin stays for `ttl` seconds so retried mints pass
+    too, a failed one is dropped once a mint has seen it.
+    """
+
+    def __init__(self, timeout: float = PIN_CONFIRM_TIMEOUT, ttl: float = PIN_GATE_TTL,
+                 max_entries: int = PIN_GATE_MAX_ENTRIES):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pins = OrderedDict()  # cid -> (created_at, future)
+
+    def __len__(self) -> int:
+        return len(self._pins)
+
+    def _future(self, cid: str) -> asyncio.Future:
+        self._expire()
+        entry = self._pins.get(cid)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            # A failed pin nobody waits for anymore isn't worth an "exception never retrieved" warning
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            entry = self._pins[cid] = (time.monotonic(), future)
+        return entry[1]
+
+    def confirm(self, cid: str, pinned_cid: str = None, error: str = None) -> str:
+        """Records the outcome of the upload of `cid`; returns "pinned", "mismatch" or "failed"."""
+        entry = self._pins.get(cid)
+        if entry is not None and entry[1].done() and entry[1].exception() is not None:
+            # The same audio uploaded again after a failed attempt
+            del self._pins[cid]
+        future = self._future(cid)
+        if future.done():
+            return "pinned"
+
+        if error or not pinned_cid:
+            failures.inc()
+            future.set_exception(PinError(f"Pinning {cid} failed: {error or 'no CID returned'}"))
+            return "failed"
+        if pinned_cid != cid:
+            mismatches.inc()
+            logger.error(f"Audio pinned as {pinned_cid}, but {cid} was computed locally.")
+            future.set_exception(PinError(f"Pinned CID {pinned_cid} doesn't match the local CID {cid}."))
+            return "mismatch"
+        future.set_result(None)
+        return "pinned"
+
+    async def wait(self, cid: str) -> None:
+        """Returns once `cid` is confirmed pinned; raises PinError if it wasn't or TimeoutError."""
+        future = self._future(cid)
+        start = time.perf_counter()
+        try:
+            # Shielded: a timed-out waiter must not cancel the pin for a retry of the same mint
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No pin confirmation for {cid} within {self.timeout:g}s.")
+        except PinError:
+            # Seen by this mint, a retry waits for a new upload instead
+            if self._pins.get(cid, (None, None))[1] is future:
+                del self._pins[cid]
+            raise
+        finally:
+            pin_wait.observe(time.perf_counter() - start)
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        while self._pins:
+            cid, (created_at, future) = next(iter(self._pins.items()))
+            if created_at > deadline and len(self._pins) < self.max_entries:
+                break
+            if not future.done():
+                future.set_exception(PinError(f"Pin confirmation for {cid} expired."))
+            del self._pins[cid]
+
+
+pin_gate = PinGate()
@@ -0,0 +1,254 @@
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# On-demand CPU profiler, shared by the bot and the API
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # Seconds between stack samples
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))  # Upper bound for any profiling session
+MODES = ("sample", "cprofile")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Last two path components are enough to tell modules apart and keep stacks short
+    path = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def collapse(thread_name: str, frame) -> str:
+    """One stack in collapsed format, root first: `thread;outer (file:line);...;inner (file:line)`."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class _Sampler(threading.Thread):
+    """Snapshots the stacks of every other thread each `interval` seconds while `gate()` is true."""
+
+    def __init__(self, interval: float, gate):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.interval = interval
+        self.gate = gate
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            if not self.gate():
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileResult:
+    """Output of one profiling session: collapsed stacks (sample mode) or pstats (cprofile mode)."""
+
+    def __init__(self, mode: str, started_at: float, duration: float, route: str = None, requests: int = 0,
+                 stacks: Counter = None, samples: int = 0, stats: pstats.Stats = None):
+        self.mode = mode
+        self.started_at = started_at
+        self.duration = duration
+        self.route = route
+        self.requests = requests
+        self.stacks = stacks
+        self.samples = samples
+        self.stats = stats
+
+    def summary(self) -> dict:
+        return {
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 3),
+            "route": self.route,
+            "requests": self.requests,
+            "samples": self.samples if self.mode == "sample" else None,
+        }
+
+    def collapsed(self) -> str:
+        """Input for flamegraph.pl, speedscope or inferno."""
+        if self.stacks is None:
+            raise ValueError("Collapsed stacks are only recorded in sample mode.")
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def pstats_text(self, sort: str = "cumulative", limit: int = 60) -> str:
+        if self.stats is None:
+            raise ValueError("pstats output is only recorded in cprofile mode.")
+        out = io.StringIO()
+        self.stats.stream = out
+        self.stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def prof_bytes(self) -> bytes:
+        """Raw profile in the `.prof` format read by pstats, snakeviz and flameprof."""
+        if self.stats is None:
+            raise ValueError("A .prof file is only recorded in cprofile mode.")
+        return marshal.dumps(self.stats.stats)
+
+
+class _Session:
+    def __init__(self, mode: str, route: str, requests: int, interval: float):
+        self.mode = mode
+        self.route = route
+        self.requests = requests
+        self.started = 0  # Matching requests let into the session
+        self.finished = 0
+        self.in_flight = 0
+        self.started_at = time.time()
+        self.clock = time.perf_counter()
+        self.timer = None
+        self.profile = cProfile.Profile() if mode == "cprofile" else None
+        # In route mode only sample while a matching request runs
+        self.sampler = _Sampler(interval, lambda: route is None or self.in_flight > 0) if mode == "sample" else None
+
+    def enter(self) -> None:
+        self.in_flight += 1
+        if self.profile is not None and self.in_flight == 1:
+            self.profile.enable()
+
+    def exit(self) -> None:
+        self.in_flight -= 1
+        self.finished += 1
+        if self.profile is not None and self.in_flight == 0:
+            self.profile.disable()
+
+    def finish(self) -> ProfileResult:
+        result = ProfileResult(self.mode, self.started_at, time.perf_counter() - self.clock, self.route, self.finished)
+        if self.sampler is not None:
+            self.sampler.stop()
+            result.stacks, result.samples = self.sampler.stacks, self.sampler.samples
+        if self.profile is not None:
+            self.profile.disable()
+            result.stats = pstats.Stats(self.profile)
+        return result
+
+
+class Profiler:
+    """Runs at most one profiling session at a time, for N seconds or for the next N requests to a route.
+
+    While idle the only cost is the `watching()` check per request. Sessions must be started
+    and stopped from the event loop thread: cProfile only records the thread that enabled it,
+    while sample mode also sees worker threads (e.g. `asyncio.to_thread` calls).
+    """
+
+    def __init__(self):
+        self._session = None
+        self.last_result = None
+
+    @property
+    def active(self) -> bool:
+        return self._session is not None
+
+    def start(self, mode: str = "sample", seconds: float = None, route: str = None, requests: int = None,
+              interval: float = SAMPLE_INTERVAL) -> None:
+        if self._session is not None:
+            raise RuntimeError("A profiling session is already running.")
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {MODES}.")
+        if route is None and not seconds:
+            raise ValueError("Give the number of seconds to profile, or a route and a number of requests.")
+        if route is not None and not requests:
+            raise ValueError("Give the number of requests to profile on the route.")
+
+        # Route sessions also end after `seconds` (or MAX_SECONDS), in case the route gets no traffic
+        seconds = min(seconds or MAX_SECONDS, MAX_SECONDS)
+        session = _Session(mode, route, requests, interval)
+        if session.sampler is not None:
+            session.sampler.start()
+        if session.profile is not None and route is None:
+            session.profile.enable()
+        session.timer = asyncio.get_running_loop().call_later(seconds, self._expire, session)
+        self._session = session
+
+        target = f"the next {requests} request(s) to {route}" if route else f"{seconds}s"
+        logger.info(f"Profiling ({mode}) started for {target}.")
+
+    def stop(self):
+        """Ends the running session; returns its result, or None if nothing was running."""
+        session, self._session = self._session, None
+        if session is None:
+            return None
+
+        session.timer.cancel()
+        self.last_result = session.finish()
+        logger.info(f"Profiling ({session.mode}) stopped after {self.last_result.duration:.1f}s "
+                    f"and {session.finished} request(s).")
+        return self.last_result
+
+    def _expire(self, session: _Session) -> None:
+        if self._session is session:
+            self.stop()
+
+    def status(self) -> dict:
+        session = self._session
+        return {
+            "active": session is not None,
+            "session": None if session is None else {
+                "mode": session.mode,
+                "route": session.route,
+                "requests": session.requests,
+                "finished_requests": session.finished,
+                "elapsed_seconds": round(time.perf_counter() - session.clock, 3),
+            },
+            "last_result": self.last_result.summary() if self.last_result else None,
+        }
+
+    def watching(self, path: str) -> bool:
+        """Whether a request to `path` should be let into the running route session."""
+        session = self._session
+        return (session is not None and session.route is not None and path.startswith(session.route)
+                and session.started < session.requests)
+
+    @contextmanager
+    def request(self):
+        """Wraps the handling of one request admitted by `watching()`."""
+        session = self._session
+        session.started += 1
+        session.enter()
+        try:
+            yield
+        finally:
+            session.exit()
+            if session.finished >= session.requests and self._session is session:
+                self.stop()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware feeding requests of the profiled route to `profiler`, a no-op otherwise."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.watching(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        with self.profiler.request():
+            await self.app(scope, receive, send)
+
+
+profiler = Profiler()
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits: ~30 messages/s overall, ~1 message/s per private chat and 20/min per group
+GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+GROUP_RATE = float(os.getenv("TG_GROUP_RATE", str(20 / 60)))
+CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "3"))
+MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))
+
+queue_wait = metrics.histogram("bot.outbound.queue_wait_seconds")
+coalesced_edits = metrics.counter("bot.outbound.coalesced_edits")
+retry_afters = metrics.counter("bot.outbound.retry_after")
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available right now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Empties the bucket so nothing goes out for `seconds` (used on 429 responses)."""
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("callback", "args", "kwargs", "data", "edit_key", "enqueued_at", "waiters")
+
+    def __init__(self, callback, args, kwargs, data, edit_key=None):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.data = data
+        self.edit_key = edit_key
+        self.enqueued_at = time.perf_counter()
+        self.waiters = []
+
+
+class _ChatLane:
+    __slots__ = ("bucket", "jobs")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.jobs = deque()
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Throttles outgoing Bot API calls with per-chat and global token buckets.
+
+    Chats with pending calls are served round-robin so one busy user can't starve the
+    others, and queued edits of the same message collapse into the latest one: callers of
+    superseded edits return right away, the latest one gets the result of the edit sent.
+    Edits of one message go out one at a time, so they can't land out of order.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE, chat_burst: int = CHAT_BURST, max_retries: int = MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._lanes = {}
+        self._ready = deque()  # Chat ids with pending jobs, in round-robin order
+        self._pending_edits = {}
+        self._sending_edits = set()  # Edit keys with a request in flight
+        self._closed = False
+        self._wakeup = asyncio.Event()
+        self._scheduler = None
+        self._running = set()
+        metrics.gauge("bot.outbound.queued", lambda: sum(len(lane.jobs) for lane in self._lanes.values()))
+
+    async def initialize(self) -> None:
+        self._closed = False
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    async def shutdown(self) -> None:
+        self._closed = True
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            self._scheduler = None
+        for lane in self._lanes.values():
+            for job in lane.jobs:
+                for waiter in job.waiters:
+                    waiter.cancel()
+        self._lanes.clear()
+        self._ready.clear()
+        self._pending_edits.clear()
+        self._sending_edits.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if self._closed:
+            # Nothing would ever send it
+            raise RuntimeError(f"{endpoint} called after the rate limiter was shut down.")
+
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # Not a chat message (answerCallbackQuery, getFile, ...), only retry on 429
+            return await self._call(callback, args, kwargs)
+
+        waiter = asyncio.get_running_loop().create_future()
+        edit_key = (chat_id, data.get("message_id"), endpoint) if endpoint.startswith("edit") else None
+
+        job = self._pending_edits.get(edit_key) if edit_key else None
+        if job is not None:
+            # Same message edited again before the previous edit went out: only send the latest
+            job.callback, job.args, job.kwargs, job.data = callback, args, kwargs, data
+            coalesced_edits.inc()
+            # True is what the Bot API returns for an edit without a message to return
+            for superseded in job.waiters:
+                if not superseded.done():
+                    superseded.set_result(True)
+            job.waiters.clear()
+        else:
+            job = _Job(callback, args, kwargs, data, edit_key)
+            lane = self._lanes.get(chat_id)
+            if lane is None:
+                rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+                lane = self._lanes[chat_id] = _ChatLane(TokenBucket(rate, self.chat_burst))
+            if not lane.jobs:
+                self._ready.append(chat_id)
+            lane.jobs.append(job)
+            if edit_key:
+                self._pending_edits[edit_key] = job
+            self._wakeup.set()
+
+        job.waiters.append(waiter)
+        return await waiter
+
+    async def _schedule(self) -> None:
+        while True:
+            if not self._ready:
+                self._prune()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = self.global_bucket.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            # Serve the next chat in round-robin order whose own bucket allows it
+            # (and that isn't waiting for an earlier edit of the same message)
+            for _ in range(len(self._ready)):
+                chat_id = self._ready[0]
+                self._ready.rotate(-1)
+                lane = self._lanes[chat_id]
+                if lane.bucket.delay(now) == 0 and lane.jobs[0].edit_key not in self._sending_edits:
+                    self._dispatch(chat_id, lane)
+                    break
+            else:
+                # Sleep until a bucket refills, or a finished edit unblocks its chat
+                waits = [self._lanes[chat_id].bucket.delay(now) for chat_id in self._ready
+                         if self._lanes[chat_id].jobs[0].edit_key not in self._sending_edits]
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(waits, default=None))
+                except asyncio.TimeoutError:
+                    pass
+
+    def _dispatch(self, chat_id, lane: _ChatLane) -> None:
+        job = lane.jobs.popleft()
+        if not lane.jobs:
+            self._ready.remove(chat_id)
+        if job.edit_key:
+            del self._pending_edits[job.edit_key]
+            self._sending_edits.add(job.edit_key)
+
+        lane.bucket.take()
+        self.global_bucket.take()
+        queue_wait.observe(time.perf_counter() - job.enqueued_at)
+        task = asyncio.create_task(self._run(job, lane))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, job: _Job, lane: _ChatLane) -> None:
+        try:
+            result = await self._call(job.callback, job.args, job.kwargs, lane.bucket)
+        except Exception as e:
+            for waiter in job.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in job.waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+        finally:
+            if job.edit_key:
+                self._sending_edits.discard(job.edit_key)
+                self._wakeup.set()
+
+    async def _call(self, callback, args, kwargs, bucket: TokenBucket = None):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_afters.inc()
+                if attempt == self.max_retries:
+                    raise
+                retry_after = float(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds")
+                                    else e.retry_after)
+                logger.warning(f"Telegram asked to retry after {retry_after}s (attempt {attempt + 1}).")
+                if bucket is not None:
+                    bucket.pause(retry_after)
+                await asyncio.sleep(retry_after)
+
+    def _prune(self) -> None:
+        # Drop idle chats whose bucket refilled, they'd start from a full bucket anyway
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, lane in self._lanes.items() if not lane.jobs and lane.bucket.full(now)]:
+            del self._lanes[chat_id]
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RPC_URLS = [url.strip() for url in os.getenv("RPC_URLS", os.getenv("RPC_URL", "http://localhost:8547")).split(",")
+            if url.strip()]
+PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", "10"))
+PROBE_TIMEOUT = float(os.getenv("RPC_PROBE_TIMEOUT", "3"))
+FAILURE_THRESHOLD = int(os.getenv("RPC_FAILURE_THRESHOLD", "3"))  # Consecutive failures that trip the breaker
+BREAKER_COOLDOWN = float(os.getenv("RPC_BREAKER_COOLDOWN", "30"))
+MAX_BLOCK_LAG = int(os.getenv("RPC_MAX_BLOCK_LAG", "5"))  # Blocks behind the best node before it's skipped
+
+failovers = metrics.counter("api.rpc.failovers")
+
+# What `cast`/`cargo stylus` print when the node, not the transaction, is the problem. Reverts, nonce and
+# balance errors come from a node that answered fine, so they don't count against it
+_ENDPOINT_ERROR_RE = re.compile(
+    r"connection refused|connection reset|connection closed|error sending request|dns error|timed out|timeout"
+    r"|HTTP error \d*5\d\d|status(?: code)?:? 5\d\d|\b(?:502|503|504)\b|bad gateway|service unavailable"
+    r"|too many requests|\b429\b",
+    re.IGNORECASE
+)
+
+
+def is_endpoint_error(stderr: str) -> bool:
+    """Whether a failed RPC command failed because of the node (unreachable, 5xx, rate limited)."""
+    return bool(_ENDPOINT_ERROR_RE.search(stderr or ""))
+
+
+class Endpoint:
+    """One RPC node with its latency estimate and circuit breaker state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = None  # Exponentially weighted moving average, seconds
+        self.block_number = None
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    def observe(self, elapsed: float) -> None:
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.open_until
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "block_number": self.block_number,
+            "healthy": self.healthy,
+            "breaker_open": time.monotonic() < self.open_until,
+            "consecutive_failures": self.failures,
+        }
+
+
+class RpcPool:
+    """Routes reads to the fastest healthy node and pins each sender's transactions to one node.
+
+    Nodes are probed in the background with `eth_blockNumber`. A node that fails
+    `failure_threshold` times in a row, in probes or real calls, is skipped for
+    `cooldown` seconds.
+    """
+
+    def __init__(self, urls: list = RPC_URLS, probe_interval: float = PROBE_INTERVAL,
+                 failure_threshold: int = FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.endpoints = {url: Endpoint(url) for url in urls}
+        self.probe_interval = probe_interval
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._pins = {}  # Sender -> url its nonce sequence goes through
+        self._probe_task = None
+        metrics.gauge("api.rpc.endpoints", self.snapshot)
+
+    def snapshot(self) -> list:
+        return [endpoint.snapshot() for endpoint in self.endpoints.values()]
+
+    def start(self) -> None:
+        # Probed even when it's the only node, so it still shows up unhealthy on /metrics
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def read_url(self, exclude: tuple = ()) -> str:
+        """The fastest available node (nodes not measured yet count as fast, so they get tried)."""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints.values() if e.available(now) and e.url not in exclude]
+        if not candidates:
+            # Everything is tripped: try the node whose breaker closes first rather than failing outright
+            candidates = [min(self.endpoints.values(), key=lambda e: e.open_until)]
+        return min(candidates, key=lambda e: e.latency or 0.0).url
+
+    def send_url(self, sender: str = "default") -> str:
+        """The node `sender` sends through, kept while it's available so nonces stay consistent."""
+        url = self._pins.get(sender)
+        if url is None or not self.endpoints[url].available(time.monotonic()):
+            new_url = self.read_url()
+            if url is not None and new_url != url:
+                failovers.inc()
+                logger.warning(f"Moving sends of {sender} from {url} to {new_url}.")
+            url = self._pins[sender] = new_url
+        return url
+
+    @contextmanager
+    def track(self, url: str, latency: bool = True):
+        """Measures a call made to `url` and feeds its outcome to the circuit breaker.
+
+        Only `ConnectionError` and `TimeoutError` count as failures of the node, any other error
+        means it answered. Calls that take longer than their round trip (sends waiting for the
+        receipt, deploys) pass `latency=False` so they don't skew the read ranking.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except (ConnectionError, TimeoutError):
+            self.record_failure(url)
+            raise
+        except Exception:
+            self.record_success(url)
+            raise
+        self.record_success(url, time.perf_counter() - start if latency else None)
+
+    def record_success(self, url: str, elapsed: float = None) -> None:
+        endpoint = self.endpoints.get(url)
+        if endpoint is not None:
+            if elapsed is not None:
+                endpoint.observe(elapsed)
+            endpoint.failures = 0
+
+    def record_failure(self, url: str) -> None:
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        endpoint.failures += 1
+        if endpoint.failures >= self.failure_threshold:
+            endpoint.open_until = time.monotonic() + self.cooldown
+            logger.warning(f"RPC endpoint {url} failed {endpoint.failures} times, skipping it for {self.cooldown}s.")
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._probe(endpoint) for endpoint in self.endpoints.values()))
+
+            # A node lagging behind the others serves stale reads
+            blocks = [e.block_number for e in self.endpoints.values() if e.block_number is not None]
+            best = max(blocks, default=0)
+            for endpoint in self.endpoints.values():
+                endpoint.healthy = endpoint.block_number is not None and best - endpoint.block_number <= MAX_BLOCK_LAG
+
+            await asyncio.sleep(self.probe_interval)
+
+    async def _probe(self, endpoint: Endpoint) -> None:
+        import requests  # Only the background probes use it, so it stays out of the API's import time
+
+        start = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(
+                requests.post,
+                endpoint.url,
+                json={"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []},
+                timeout=PROBE_TIMEOUT
+            )
+            response.raise_for_status()
+            endpoint.block_number = int(response.json()["result"], 16)
+        except Exception as e:
+            # Every probe failure counts, the probe is nothing but a round trip to the node
+            endpoint.block_number = None
+            self.record_failure(endpoint.url)
+            logger.debug(f"RPC probe of {endpoint.url} failed: {e}")
+            return
+        self.record_success(endpoint.url, time.perf_counter() - start)
+
+
+rpc_pool = RpcPool()
@@ -0,0 +1,150 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+
+from .utils import restore_data
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH")  # Append-only JSONL of indexed songs, replayed on startup
+
+# Matches in the title count more than in the lyrics, the auto-generated description counts least
+FIELD_WEIGHTS = {"title": 3.0, "lyrics": 1.0, "description": 0.5}
+K1 = 1.2
+B = 0.75
+MIN_IDF = 0.1  # Roughly a term found in over 90% of the songs
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens; newlines escaped by `sanitize_data` are turned back into separators first."""
+    return _TOKEN_RE.findall(restore_data(text or "").lower())
+
+
+@dataclass(slots=True)
+class SongDocument:
+    """What the index keeps about one minted song."""
+    contract_address: str
+    token_id: int
+    title: str
+    lyrics: str
+    description: str
+    owner_address: str = ""
+    music: str = ""
+
+    @property
+    def key(self) -> tuple:
+        return self.contract_address.lower(), self.token_id
+
+
+class SearchIndex:
+    """In-memory inverted index over title, lyrics and description, ranked with BM25.
+
+    Term frequencies of the fields are weighted by `FIELD_WEIGHTS` before scoring (a
+    simple BM25F). Songs are added one by one as they are minted.
+    """
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        self._documents = {}  # key -> SongDocument
+        self._lengths = {}  # key -> weighted number of tokens
+        self._postings = defaultdict(dict)  # term -> {key: weighted term frequency}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def load(self) -> None:
+        """Rebuilds the index from the JSONL log at `path`, if there is one."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._index(SongDocument(**json.loads(line)))
+        logger.info(f"Search index loaded {len(self)} songs from {self.path}")
+
+    def add(self, document: SongDocument) -> None:
+        """Indexes `document` in memory, searchable right away; `persist` writes it to the log."""
+        self._index(document)
+
+    def persist(self, document: SongDocument) -> None:
+        """Appends `document` to the JSONL log at `path`, if there is one. Blocking file I/O."""
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(document), ensure_ascii=False) + "\n")
+
+    def _index(self, document: SongDocument) -> None:
+        key = document.key
+        if key in self._documents:
+            self._remove(key)
+
+        frequencies = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(getattr(document, field)):
+                frequencies[term] += weight
+
+        for term, frequency in frequencies.items():
+            self._postings[term][key] = frequency
+        self._documents[key] = document
+        self._lengths[key] = sum(frequencies.values())
+        self._total_length += self._lengths[key]
+
+    def _remove(self, key: tuple) -> None:
+        document = self._documents.pop(key)
+        self._total_length -= self._lengths.pop(key)
+        for field in FIELD_WEIGHTS:
+            for term in set(tokenize(getattr(document, field))):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        terms = set(tokenize(query))
+        if not terms or not self._documents:
+            return []
+
+        count = len(self._documents)
+        average_length = self._total_length / count or 1.0
+        weighted = []
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings:
+                weighted.append((math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)), postings))
+
+        # Terms in nearly every song (e.g. the default description) barely move the ranking but cost a
+        # full scan, so they only count when the query has nothing rarer
+        if any(idf >= MIN_IDF for idf, _ in weighted):
+            weighted = [(idf, postings) for idf, postings in weighted if idf >= MIN_IDF]
+
+        scores = defaultdict(float)
+        for idf, postings in weighted:
+            for key, frequency in postings.items():
+                norm = K1 * (1 - B + B * self._lengths[key] / average_length)
+                scores[key] += idf * frequency * (K1 + 1) / (frequency + norm)
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [self._result(self._documents[key], score, terms) for key, score in ranked]
+
+    @staticmethod
+    def _result(document: SongDocument, score: float, terms: set) -> dict:
+        # First lyrics line mentioning a query term, to show why the song matched
+        snippet = next((line.strip() for line in restore_data(document.lyrics).splitlines()
+                        if terms & set(tokenize(line))), "")
+        return {
+            "contract_address": document.contract_address,
+            "token_id": document.token_id,
+            "title": document.title,
+            "owner_address": document.owner_address,
+            "music": document.music,
+            "snippet": snippet[:200],
+            "score": round(score, 4),
+        }
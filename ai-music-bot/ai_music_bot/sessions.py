@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Optional
+
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))  # Seconds since last use
+
+
+@dataclass(slots=True)
+class UserSession:
+    """Bot-side state of one Telegram user while they prepare and mint a song."""
+    status: Optional[str] = None
+    file_id: Optional[str] = None
+    title: Optional[str] = None
+    lyrics: Optional[str] = None
+    meta: Optional[str] = None
+    owner_address: Optional[str] = None
+    awaiting_lyrics: bool = False
+    awaiting_title: bool = False
+    nft_address: Optional[str] = None
+    nft_token_id: int = 1
+
+
+@dataclass(slots=True)
+class RegisteredUser:
+    """API-side registration data linking a Telegram user to their wallet."""
+    email: str
+    user_id: str
+    wallet_address: str
+    chain_type: str
+    status: str = "registered"
+
+
+def record_size(record) -> int:
+    """Approximate bytes held by a slotted record, including its field values."""
+    return sys.getsizeof(record) + sum(sys.getsizeof(getattr(record, f.name)) for f in fields(record))
+
+
+class SessionStore:
+    """Dict-like session container bounded by count (LRU) and idle time (TTL).
+
+    Keys that were evicted are remembered (up to `max_users` of them), so callers can
+    tell a user whose session expired from one who never had one. Pinned keys are never
+    evicted, so a session can't disappear under a mint that still writes to it.
+    """
+
+    def __init__(self, max_users: int = SESSION_MAX_USERS, ttl: float = SESSION_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # key -> (last_used, record), least recently used first
+        self._evicted = OrderedDict()
+        self._pins = {}  # key -> number of pins held
+        self.evictions = {"lru": 0, "ttl": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        record = self.get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __setitem__(self, key, record) -> None:
+        self._sessions[key] = (time.monotonic(), record)
+        self._sessions.move_to_end(key)
+        self._evicted.pop(key, None)
+        self._expire()
+        while len(self._sessions) > self.max_users:
+            # Never the session just written, its caller is about to use it
+            victim = next((k for k in self._sessions if k not in self._pins and k != key), None)
+            if victim is None:
+                break  # Everything else is pinned, go over the limit until a pin is released
+            self._evict(victim, "lru")
+
+    def get(self, key, default=None):
+        entry = self._sessions.get(key)
+        if entry is None:
+            return default
+
+        now = time.monotonic()
+        if now - entry[0] > self.ttl and key not in self._pins:
+            self._evict(key, "ttl")
+            return default
+
+        self._sessions[key] = (now, entry[1])
+        self._sessions.move_to_end(key)
+        return entry[1]
+
+    def pop(self, key, default=None):
+        entry = self._sessions.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def pin(self, key) -> None:
+        """Keeps `key` from being evicted until the matching `unpin`."""
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key) -> None:
+        count = self._pins.pop(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+
+    def expired(self, key) -> bool:
+        """True if `key` had a session that was evicted."""
+        return key not in self._sessions and key in self._evicted
+
+    def _expire(self) -> None:
+        # Least recently used entries come first, so stop at the first one still fresh
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            key, (last_used, _) = next(iter(self._sessions.items()))
+            if last_used > deadline:
+                break
+            if key in self._pins:
+                # Still in use, counts as used now
+                self._sessions[key] = (time.monotonic(), self._sessions[key][1])
+                self._sessions.move_to_end(key)
+                continue
+            self._evict(key, "ttl")
+
+    def _evict(self, key, reason: str) -> None:
+        del self._sessions[key]
+        self.evictions[reason] += 1
+        self._evicted[key] = None
+        while len(self._evicted) > self.max_users:
+            self._evicted.popitem(last=False)
+
+    def stats(self, sample: int = 100) -> dict:
+        """Size, eviction counts and the average memory per session over a sample."""
+        records = [record for _, record in list(self._sessions.values())[-sample:]]
+        avg_bytes = sum(record_size(r) for r in records) / len(records) if records else 0
+        return {
+            "sessions": len(self._sessions),
+            "max_users": self.max_users,
+            "evictions": dict(self.evictions),
+            "avg_session_bytes": round(avg_bytes),
+        }
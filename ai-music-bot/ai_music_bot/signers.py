@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from . import metrics
+from .rpc_pool import rpc_pool
+from .subprocesses import executor
+
+logger = logging.getLogger(__name__)
+
+PRIVATE_KEYS = [key.strip() for key in os.getenv("PRIVATE_KEYS", os.getenv("PRIVATE_KEY", "")).split(",")
+                if key.strip()]
+MIN_BALANCE_WEI = int(float(os.getenv("SIGNER_MIN_BALANCE_ETH", "0.01")) * 10 ** 18)
+BALANCE_CHECK_INTERVAL = float(os.getenv("SIGNER_BALANCE_CHECK_INTERVAL", "300"))
+THROUGHPUT_WINDOW = 600  # Seconds of finished jobs kept for the per-signer rate
+
+low_balance_alerts = metrics.counter("api.signers.low_balance_alerts")
+
+
+class Signer:
+    """One deployer key: its own nonce sequence, so only one job uses it at a time."""
+
+    def __init__(self, key: str, index: int):
+        self.key = key
+        self.index = index
+        self.address = None  # Resolved with `cast wallet address` on startup
+        self.lock = asyncio.Lock()
+        self.in_flight = 0  # Jobs holding or waiting for this signer
+        self.sent = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.balance = None  # Wei
+        self.low_balance = False
+        self._finished = deque()  # Completion times within THROUGHPUT_WINDOW
+
+    @property
+    def name(self) -> str:
+        return self.address or f"signer-{self.index}"
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        now = time.monotonic()
+        if ok:
+            self.sent += 1
+            self._finished.append(now)
+        else:
+            self.failed += 1
+        self.busy_seconds += elapsed
+        while self._finished and self._finished[0] < now - THROUGHPUT_WINDOW:
+            self._finished.popleft()
+
+    def snapshot(self) -> dict:
+        return {
+            "address": self.name,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "per_minute": round(len(self._finished) * 60 / THROUGHPUT_WINDOW, 2),
+            "avg_seconds": round(self.busy_seconds / (self.sent + self.failed), 2) if self.sent + self.failed else None,
+            "balance_eth": self.balance / 10 ** 18 if self.balance is not None else None,
+            "low_balance": self.low_balance,
+        }
+
+
+class SignerPool:
+    """Spreads chain jobs over several deployer keys, each key running one job at a time.
+
+    A job goes to the signer with the fewest jobs in flight, preferring signers whose last
+    balance check was above `SIGNER_MIN_BALANCE_ETH`. Balances are checked every
+    `SIGNER_BALANCE_CHECK_INTERVAL` seconds, and a signer running low is logged once until
+    it's topped up.
+    """
+
+    def __init__(self, keys: list = PRIVATE_KEYS, min_balance: int = MIN_BALANCE_WEI,
+                 check_interval: float = BALANCE_CHECK_INTERVAL):
+        self.signers = [Signer(key, index) for index, key in enumerate(keys)]
+        self.min_balance = min_balance
+        self.check_interval = check_interval
+        self._balance_task = None
+        metrics.gauge("api.signers", self.snapshot)
+
+    def snapshot(self) -> list:
+        return [signer.snapshot() for signer in self.signers]
+
+    async def start(self) -> None:
+        # Concurrently, startup waits for the slowest key rather than for all of them in a row
+        await asyncio.gather(*(self._resolve_address(signer) for signer in self.signers))
+        # A key without an address can't be pinned to a node or own a collection, so it gets no jobs
+        # until a balance check resolves it
+        unresolved = [signer for signer in self.signers if signer.address is None]
+        if unresolved:
+            logger.error(f"{len(unresolved)} signer(s) didn't resolve, retrying with the balance checks: "
+                         f"{', '.join(signer.name for signer in unresolved)}")
+        if self.signers and self._balance_task is None:
+            self._balance_task = asyncio.create_task(self._balance_loop())
+        logger.info(f"Signer pool: {', '.join(signer.name for signer in self.resolved) or 'no usable keys'}")
+
+    @property
+    def resolved(self) -> list:
+        return [signer for signer in self.signers if signer.address is not None]
+
+    def stop(self) -> None:
+        if self._balance_task is not None:
+            self._balance_task.cancel()
+            self._balance_task = None
+
+    @asynccontextmanager
+    async def acquire(self, signer: Signer = None):
+        """Holds the least-loaded signer (or `signer`, e.g. the one that deployed a contract) for a job."""
+        if signer is None:
+            if not self.signers:
+                raise ValueError("No usable signer keys, set PRIVATE_KEYS or PRIVATE_KEY.")
+            resolved = self.resolved
+            if not resolved:
+                raise RuntimeError("No signer address resolved yet, they're retried with the balance checks.")
+            funded = [signer for signer in resolved if not signer.low_balance] or resolved
+            signer = min(funded, key=lambda s: (s.in_flight, s.sent + s.failed))
+        signer.in_flight += 1
+        try:
+            async with signer.lock:
+                start = time.perf_counter()
+                try:
+                    yield signer
+                except BaseException:
+                    signer.record(False, time.perf_counter() - start)
+                    raise
+                signer.record(True, time.perf_counter() - start)
+        finally:
+            signer.in_flight -= 1
+
+    async def _resolve_address(self, signer: Signer) -> None:
+        try:
+            result = await executor.run("read", "cast", "wallet", "address", "--private-key", signer.key)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip())
+            signer.address = result.stdout.strip()
+        except Exception as e:
+            logger.error(f"Could not resolve the address of signer {signer.index}: {e}")
+
+    async def check_balances(self) -> None:
+        for signer in self.signers:
+            if signer.address is None:
+                await self._resolve_address(signer)
+                if signer.address is None:
+                    continue
+                logger.info(f"Signer {signer.index} resolved to {signer.address}, it takes jobs now.")
+            try:
+                result = await executor.run("read", "cast", "balance", signer.address, "--rpc-url", rpc_pool.read_url())
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip())
+                signer.balance = int(result.stdout.strip())
+            except Exception as e:
+                logger.warning(f"Balance check of {signer.address} failed: {e}")
+                continue
+
+            low = signer.balance < self.min_balance
+            if low and not signer.low_balance:
+                low_balance_alerts.inc()
+                logger.warning(f"Signer {signer.address} is low on funds: {signer.balance / 10 ** 18:.6f} ETH "
+                               f"(minimum {self.min_balance / 10 ** 18:g} ETH). Top it up; it only gets jobs "
+                               f"while no funded signer is available.")
+            elif signer.low_balance and not low:
+                logger.info(f"Signer {signer.address} topped up: {signer.balance / 10 ** 18:.6f} ETH.")
+            signer.low_balance = low
+
+    async def _balance_loop(self) -> None:
+        while True:
+            await self.check_balances()
+            await asyncio.sleep(self.check_interval)
+
+
+signer_pool = SignerPool()
@@ -0,0 +1,139 @@
+"""Measures how fast the bot and the API start: import time per package and time until ready.
+
+Import times come from `python -X importtime` in a fresh interpreter, summed per top-level
+package (self time, so a package is only charged for its own modules). Time until ready is
+wall time from spawning the process until it can serve:
+  - API: uvicorn has run the startup hooks and answers GET /metrics.
+  - Bot: the Application is built and initialized (against the stubbed Bot API of loadtest.py).
+
+Usage:
+    python ai_music_bot/startup_bench.py
+    python ai_music_bot/startup_bench.py --target api --runs 5 --top 20
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(APP_DIR)  # `uvicorn ai_music_bot.main:app` runs from here
+READY_TIMEOUT = 60
+
+BOT_READY = """
+import asyncio
+import bot
+from loadtest import FAKE_TOKEN, StubTelegramRequest
+
+async def ready():
+    app = bot.build_application(token=FAKE_TOKEN, request=StubTelegramRequest())
+    await app.initialize()
+    print("READY", flush=True)
+    await app.shutdown()
+
+asyncio.run(ready())
+"""
+
+# Module imported by each entry point, and the directory it's imported from
+TARGETS = {
+    "bot": ("bot", APP_DIR),
+    "api": ("ai_music_bot.main", PROJECT_ROOT),
+}
+
+
+def import_times(module: str, cwd: str) -> tuple:
+    """(total seconds, {package: self seconds}) of importing `module` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    packages = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        # import time:  self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+        if name.strip() == module:
+            total = int(cumulative_us) / 1e6
+    return total, packages
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def api_ready_time() -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "ai_music_bot.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < READY_TIMEOUT:
+            if process.poll() is not None:
+                raise RuntimeError(f"The API exited with code {process.returncode} before it was ready.")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"The API wasn't ready after {READY_TIMEOUT}s.")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bot_ready_time() -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", BOT_READY], cwd=APP_DIR,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in process.stdout:
+            if line.strip() == "READY":
+                return time.perf_counter() - start
+        raise RuntimeError(f"The bot exited with code {process.wait()} before it was ready.")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def report(target: str, runs: int, top: int) -> None:
+    module, cwd = TARGETS[target]
+    totals = []
+    packages = defaultdict(list)
+    for _ in range(runs):
+        total, per_package = import_times(module, cwd)
+        totals.append(total)
+        for name, seconds in per_package.items():
+            packages[name].append(seconds)
+
+    ready = [api_ready_time() if target == "api" else bot_ready_time() for _ in range(runs)]
+
+    print(f"\n{target}: import {module} median {statistics.median(totals) * 1000:.0f}ms, "
+          f"ready median {statistics.median(ready) * 1000:.0f}ms (min {min(ready) * 1000:.0f}ms, {runs} runs)")
+    print("Slowest packages to import (median self time):")
+    medians = sorted(((statistics.median(samples), name) for name, samples in packages.items()), reverse=True)
+    for seconds, name in medians[:top]:
+        print(f"  {name:<30} {seconds * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("bot", "api", "all"), default="all")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Packages listed per target")
+    args = parser.parse_args()
+
+    for target in TARGETS if args.target == "all" else (args.target,):
+        report(target, args.runs, args.top)
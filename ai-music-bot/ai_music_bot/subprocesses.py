@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import subprocess
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessClass:
+    """Concurrency limit, timeout and priority (lower runs first) of one kind of child process."""
+
+    def __init__(self, name: str, limit: int, timeout: float, priority: int):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.priority = priority
+        self.running = 0
+        self.queue_wait = metrics.histogram(f"api.subprocess.{name}.queue_wait_seconds")
+        self.run_time = metrics.histogram(f"api.subprocess.{name}.run_seconds")
+        self.timeouts = metrics.counter(f"api.subprocess.{name}.timeouts")
+
+
+# Metadata reads are cheap and user-facing, so they go first; builds and deploys are the heavy ones
+PROCESS_CLASSES = {
+    "read": ProcessClass("read", int(os.getenv("SUBPROCESS_READ_LIMIT", "8")),
+                         float(os.getenv("RPC_CALL_TIMEOUT", "20")), 0),
+    "send": ProcessClass("send", int(os.getenv("SUBPROCESS_SEND_LIMIT", "4")),
+                         float(os.getenv("RPC_SEND_TIMEOUT", "120")), 1),
+    "deploy": ProcessClass("deploy", int(os.getenv("SUBPROCESS_DEPLOY_LIMIT", "2")),
+                           float(os.getenv("DEPLOY_TIMEOUT", "300")), 2),
+    "build": ProcessClass("build", int(os.getenv("SUBPROCESS_BUILD_LIMIT", "1")),
+                          float(os.getenv("BUILD_TIMEOUT", "600")), 3),
+}
+MAX_PROCESSES = int(os.getenv("SUBPROCESS_MAX_PROCESSES", "12"))  # Across all classes
+
+
+class _Slot:
+    """A granted run permit; `run()` spawns the child process with the class timeout."""
+
+    def __init__(self, executor, process_class: ProcessClass):
+        self.executor = executor
+        self.process_class = process_class
+
+    async def __aenter__(self):
+        enqueued_at = time.perf_counter()
+        await self.executor._acquire(self.process_class)
+        self.started_at = time.perf_counter()
+        self.process_class.queue_wait.observe(self.started_at - enqueued_at)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.process_class.run_time.observe(time.perf_counter() - self.started_at)
+        self.executor._release(self.process_class)
+
+    async def run(self, *command: str, cwd: str = None, timeout: float = None) -> subprocess.CompletedProcess:
+        timeout = timeout or self.process_class.timeout
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            self.process_class.timeouts.inc()
+            raise TimeoutError(f"{' '.join(command[:3])} timed out after {timeout:g}s.")
+        except asyncio.CancelledError:
+            # The caller went away, don't leave the child running
+            process.kill()
+            raise
+        return subprocess.CompletedProcess(command, process.returncode, stdout.decode(), stderr.decode())
+
+
+class SubprocessExecutor:
+    """Runs `cargo`/`cast` child processes under per-class limits and a global process cap.
+
+    When a process finishes, the freed slot goes to the waiting call with the best priority
+    whose own class still has room, so a queue of deploys never holds up metadata reads.
+    """
+
+    def __init__(self, classes: dict = PROCESS_CLASSES, max_processes: int = MAX_PROCESSES):
+        self.classes = classes
+        self.max_processes = max_processes
+        self.running = 0
+        self._waiters = []  # Sorted (priority, sequence, class, future)
+        self._sequence = itertools.count()
+        metrics.gauge("api.subprocess.state", self.snapshot)
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "running": process_class.running,
+                "queued": sum(1 for waiter in self._waiters if waiter[2] is process_class),
+                "limit": process_class.limit,
+            }
+            for name, process_class in self.classes.items()
+        }
+
+    def slot(self, kind: str) -> _Slot:
+        """`async with executor.slot("send") as slot: await slot.run(...)`, waits for a free slot first."""
+        return _Slot(self, self.classes[kind])
+
+    async def run(self, kind: str, *command: str, cwd: str = None, timeout: float = None) -> subprocess.CompletedProcess:
+        async with self.slot(kind) as slot:
+            return await slot.run(*command, cwd=cwd, timeout=timeout)
+
+    def _can_run(self, process_class: ProcessClass) -> bool:
+        return process_class.running < process_class.limit and self.running < self.max_processes
+
+    async def _acquire(self, process_class: ProcessClass) -> None:
+        # Anyone already waiting is blocked by their class limit or the global cap, never by us
+        if self._can_run(process_class):
+            self._start(process_class)
+            return
+
+        waiter = (process_class.priority, next(self._sequence), process_class,
+                  asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter, key=lambda w: w[:2])
+        try:
+            await waiter[3]
+        except asyncio.CancelledError:
+            if waiter[3].done() and not waiter[3].cancelled():
+                # Granted right as we were cancelled: hand the slot on
+                self._release(process_class)
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _start(self, process_class: ProcessClass) -> None:
+        process_class.running += 1
+        self.running += 1
+
+    def _release(self, process_class: ProcessClass) -> None:
+        process_class.running -= 1
+        self.running -= 1
+
+        for waiter in list(self._waiters):
+            if self.running >= self.max_processes:
+                break
+            if self._can_run(waiter[2]):
+                self._waiters.remove(waiter)
+                self._start(waiter[2])
+                waiter[3].set_result(None)
+
+
+executor = SubprocessExecutor()
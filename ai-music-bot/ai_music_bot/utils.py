@@ -1,13 +1,7 @@
-import logging
 import json
-import base64
-from fastapi import HTTPException
-import asyncio
+import logging
 from dotenv import load_dotenv
 import os
-import requests
-import binascii
-from eth_abi import decode
 import random
 
 load_dotenv()
@@ -27,70 +21,10 @@ def restore_data(sanitized_data: str) -> str:
     return sanitized_data.replace("\\n", "\n")
 
 
-async def get_nft_metadata_from_contract(contract_address: str):
-    """Calls the smart contract to get NFT metadata using cast call and decodes ABI-encoded response."""
-    try:
-        # Validate contract address
-        if not contract_address.startswith("0x"):
-            raise ValueError("Invalid contract address.")
-
-        # Command to fetch tokenURI
-        command = [
-            "cast", "call", contract_address,
-            "--rpc-url", os.getenv("RPC_URL", "http://localhost:8547"),
-            "--private-key", os.getenv("PRIVATE_KEY"),
-            "tokenURI(uint256)", "1"
-        ]
-
-        logger.info(f"Fetching NFT metadata: {command}")
-
-        # Execute the command asynchronously
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-
-        stdout, stderr = await process.communicate()
-        raw_output = stdout.decode().strip() + stderr.decode().strip()
-
-        logger.info(f"Raw NFT Metadata Response: {raw_output}")
-
-        if not raw_output:
-            raise HTTPException(status_code=500, detail="Failed to fetch NFT metadata.")
-
-        # Step 1: Remove "0x" prefix if present
-        if raw_output.startswith("0x"):
-            raw_output = raw_output[2:]
-
-        # Step 2: Convert hex string to bytes
-        response_bytes = binascii.unhexlify(raw_output)
-
-        # Step 3: Decode the ABI-encoded `string` response
-        decoded_data = decode(["string"], response_bytes)[0]
-
-        # Step 4: Extract Base64 JSON part and fix padding
-        metadata_base64 = decoded_data.replace("data:application/json;base64,", "").strip()
-        missing_padding = len(metadata_base64) % 4
-        if missing_padding:
-            metadata_base64 += "=" * (4 - missing_padding)
-
-        # Step 5: Decode Base64 JSON
-        metadata_json = base64.b64decode(metadata_base64).decode()
-        metadata_dict = json.loads(metadata_json)
-
-        logging.info(f"\n\nnft_data: {metadata_dict}\n\n")
-
-        metadata_dict["lyrics"] = restore_data(metadata_dict["lyrics"])
-
-        return metadata_dict
-
-    except Exception as e:
-        logger.error(f"Error fetching NFT metadata: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 def upload_to_ipfs(file_path):
+    # The API only needs the text helpers of this module, so requests is imported where it's used
+    import requests
+
     # Load your Pinata API key and secret from environment variables for security
     pinata_api_key = os.getenv("PINATA_API_KEY")
     pinata_api_secret = os.getenv("PINATA_API_SECRET")
@@ -106,10 +40,11 @@ def upload_to_ipfs(file_path):
                 "pinata_secret_api_key": pinata_api_secret
             }
 
-            # Send the file to Pinata
+            # Send the file to Pinata, as a CIDv0 so it matches the CID computed locally (see ipfs_cid.py)
             response = requests.post(
                 "https://api.pinata.cloud/pinning/pinFileToIPFS",
                 files={"file": f},
+                data={"pinataOptions": json.dumps({"cidVersion": 0})},
                 headers=headers
             )
 
@@ -225,6 +160,8 @@ def generate_cosmic_svg(title: str) -> str:
 
 # Function to retrieve user data by user_id from the FastAPI endpoint
 def get_user_data(user_id: str):
+    import requests
+
     url = f"{os.getenv('BASE_URL', 'http://127.0.0.1:8000')}/get_user/{user_id}"  # Replace with your FastAPI server URL
     try:
         response = requests.get(url)
@@ -0,0 +1,32 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+
+# Background warmup of lazily imported modules, shared by the bot and the API
+logger = logging.getLogger(__name__)
+
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+
+def _import(name: str) -> float:
+    start = time.perf_counter()
+    importlib.import_module(name)
+    return time.perf_counter() - start
+
+
+async def preload(*modules: str) -> None:
+    """Imports modules that are otherwise loaded on first use, in a worker thread.
+
+    Meant to run as a task once the service is up: startup doesn't wait for these imports,
+    and the first request that needs one of them doesn't pay for it either. A module that
+    fails to import is logged and left to fail again where it's actually used.
+    """
+    for name in modules:
+        try:
+            elapsed = await asyncio.to_thread(_import, name)
+        except Exception as e:
+            logger.warning(f"Warmup import of {name} failed: {e}")
+            continue
+        logger.info(f"Warmed up {name} in {elapsed * 1000:.0f}ms")
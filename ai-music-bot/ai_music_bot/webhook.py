@@ -0,0 +1,177 @@
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Serving mode settings
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public URL Telegram posts to, e.g. https://bot.example.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")  # Behind the same reverse proxy as the API
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+MAX_CONCURRENT_UPDATES = int(os.getenv("BOT_MAX_CONCURRENT_UPDATES", "32"))
+DRAIN_TIMEOUT = float(os.getenv("BOT_DRAIN_TIMEOUT", "30"))
+
+
+class DrainingUpdateProcessor(BaseUpdateProcessor):
+    """Processes up to `max_concurrent_updates` updates at once and drains them on shutdown."""
+
+    def __init__(self, max_concurrent_updates: int, drain_timeout: float = DRAIN_TIMEOUT):
+        super().__init__(max_concurrent_updates)
+        self.drain_timeout = drain_timeout
+        self._in_flight = set()
+        self._draining = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def do_process_update(self, update, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._in_flight.add(task)
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not self._draining:
+                raise
+            logger.warning(f"Update {getattr(update, 'update_id', '?')} cancelled after drain timeout.")
+        finally:
+            self._in_flight.discard(task)
+
+    def start_drain(self) -> None:
+        """Lets in-flight updates finish, cancelling whatever is left after `drain_timeout`."""
+        if self._draining:
+            return
+        self._draining = True
+        logger.info(f"Draining {self.in_flight} in-flight update(s), up to {self.drain_timeout}s...")
+        asyncio.get_running_loop().call_later(self.drain_timeout, self._cancel_in_flight)
+
+    def _cancel_in_flight(self) -> None:
+        for task in list(self._in_flight):
+            task.cancel()
+
+    async def wait_drained(self) -> None:
+        """Returns once every update handed over so far is done (or was cancelled by the drain)."""
+        while self._in_flight:
+            # asyncio.wait, unlike gather, doesn't cancel the updates if the caller is cancelled
+            await asyncio.wait(list(self._in_flight))
+
+    async def initialize(self) -> None:
+        self._draining = False
+
+    async def shutdown(self) -> None:
+        await self.wait_drained()
+
+
+def build_webhook_app(application: Application):
+    """Builds the ASGI app that receives Telegram updates and feeds them to the bot."""
+    from fastapi import FastAPI, Request, Response
+
+    webhook_app = FastAPI()
+
+    @webhook_app.post(WEBHOOK_PATH)
+    async def telegram_webhook(request: Request) -> Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return Response(status_code=403)
+
+        # Acknowledge right away, the update is processed in the background
+        update = Update.de_json(await request.json(), application.bot)
+        await application.update_queue.put(update)
+        return Response(status_code=200)
+
+    @webhook_app.get("/healthz")
+    async def healthz():
+        return {"status": "ok", "in_flight": application.update_processor.in_flight}
+
+    @webhook_app.get("/metrics")
+    async def get_metrics():
+        return metrics.snapshot()
+
+    return webhook_app
+
+
+def build_webhook_server(config):
+    """A uvicorn server that leaves SIGINT/SIGTERM to `serve()`.
+
+    uvicorn re-raises the signals it captured once it stops, which would kill the process
+    before the in-flight updates are drained.
+    """
+    import uvicorn
+
+    class WebhookServer(uvicorn.Server):
+        @contextlib.contextmanager
+        def capture_signals(self):
+            yield
+
+        def install_signal_handlers(self) -> None:
+            # Same hook in older uvicorn versions
+            pass
+
+    return WebhookServer(config)
+
+
+async def stop_gracefully(application: Application) -> None:
+    """Stops an application that no longer receives updates, once the ones it has are handled.
+
+    The processor may return before a handler is done (see dispatch.py), and the shutdown that
+    follows closes the bot and its rate limiter first, so the drain is awaited in between.
+    """
+    processor = application.update_processor
+    if isinstance(processor, DrainingUpdateProcessor):
+        processor.start_drain()
+    # Hands the updates received so far to the processor
+    await application.stop()
+    if isinstance(processor, DrainingUpdateProcessor):
+        # Bounded by the drain timeout, which cancels whatever is left
+        await processor.wait_drained()
+
+
+async def serve(application: Application, mode: str = BOT_MODE) -> None:
+    """Runs the bot in polling or webhook mode until SIGINT/SIGTERM, then drains gracefully."""
+    loop = asyncio.get_running_loop()
+
+    async with application:
+        if mode == "webhook":
+            import uvicorn
+
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=MAX_CONCURRENT_UPDATES,
+                )
+            server = build_webhook_server(uvicorn.Config(
+                build_webhook_app(application),
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                log_level="info",
+            ))
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, setattr, server, "should_exit", True)
+
+            await application.start()
+            logger.info(f"Bot is serving webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+            # Returns once a signal asked it to stop and it stopped accepting requests
+            await server.serve()
+        else:
+            stop_event = asyncio.Event()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop_event.set)
+
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+            logger.info("Bot is polling...")
+            await stop_event.wait()
+            await application.updater.stop()
+
+        await stop_gracefully(application)
@@ -0,0 +1,96 @@
+"""Feeds synthetic Telegram updates into a locally running webhook bot.
+
+Usage:
+    BOT_MODE=webhook python ai_music_bot/bot.py
+    python ai_music_bot/webhook_harness.py --users 50 --updates 4
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import time
+
+import httpx
+
+WEBHOOK_URL = f"http://{os.getenv('WEBHOOK_LISTEN', '127.0.0.1')}:{os.getenv('WEBHOOK_PORT', '8443')}" \
+              f"{os.getenv('WEBHOOK_PATH', '/telegram')}"
+
+update_ids = itertools.count(1)
+
+
+def command_update(user_id: int, command: str) -> dict:
+    """Builds a synthetic update for a private-chat command message."""
+    update_id = next(update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split()[0])}],
+        },
+    }
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    """Builds a synthetic update for an inline button press."""
+    update_id = next(update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "synthetic",
+            },
+        },
+    }
+
+
+async def run_user(client: httpx.AsyncClient, user_id: int, updates: int, secret: str, latencies: list) -> None:
+    flow = itertools.cycle([
+        lambda: command_update(user_id, "/register"),
+        lambda: command_update(user_id, "/start"),
+        lambda: callback_update(user_id, "set_lyrics"),
+        lambda: callback_update(user_id, "verify_data"),
+    ])
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    for build in itertools.islice(flow, updates):
+        start = time.perf_counter()
+        response = await client.post(WEBHOOK_URL, json=build(), headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def main(users: int, updates: int, secret: str) -> None:
+    latencies = []
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        await asyncio.gather(*(
+            run_user(client, 10_000_000 + i, updates, secret, latencies) for i in range(users)
+        ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"Sent {len(latencies)} updates from {users} users in {elapsed:.2f}s")
+    print(f"Ack latency p50={statistics.median(latencies) * 1000:.1f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms "
+          f"max={latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=4, help="Updates sent per user")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users, args.updates, args.secret))
@@ -2,14 +2,26 @@
 extern crate alloc;
 use stylus_sdk::{alloy_primitives::{Address, U256}, prelude::*};
 use stylus_sdk::{alloy_sol_types::sol, evm};
-use stylus_sdk::storage::{StorageAddress, StorageString};
+use stylus_sdk::storage::{StorageAddress, StorageBool, StorageMap, StorageString, StorageU256};
 use stylus_sdk::block;
+use stylus_sdk::contract;
+use stylus_sdk::msg;
 use stylus_sdk::tx;
 
 /// Event emitted when a mint occurs
 sol! {
-    event Minted(address indexed owner);
     event LogMintingSuccess(string message);
+    event Transfer(address indexed from, address indexed to, uint256 indexed tokenId);
+}
+
+/// Metadata of a single token in collection mode
+#[storage]
+pub struct TokenData {
+    title: StorageString,
+    lyrics: StorageString,
+    meta: StorageString,
+    music_data: StorageString,
+    svg_template: StorageString,
 }
 
 #[entrypoint]
@@ -35,6 +47,21 @@ pub struct Contract {
 
     /// SVG Template with placeholders
     svg_template: StorageString,
+
+    /// Collection mode: accounts allowed to mint new tokens
+    minters: StorageMap<Address, StorageBool>,
+
+    /// Collection mode: number of tokens minted so far (token ids start at 1)
+    total_supply: StorageU256,
+
+    /// Collection mode: owner of each token
+    token_owners: StorageMap<U256, StorageAddress>,
+
+    /// Collection mode: number of tokens held by each account
+    balances: StorageMap<Address, StorageU256>,
+
+    /// Collection mode: metadata of each token
+    tokens: StorageMap<U256, TokenData>,
 }
 
 #[public]
@@ -44,21 +71,6 @@ impl Contract {
         matches!(interface, [0x01, 0xff, 0xc9, 0xa7] | [0x80, 0xac, 0x58, 0xcd] | [0x5b, 0x5e, 0x13, 0x9f])
     }
 
-    /// Mint function: Mints the NFT to the specified address
-    pub fn mint(&mut self, to: Address) {
-        // Check if the NFT has already been minted
-        assert!(self.owner.get() == Address::ZERO, "Already minted!");
-
-        // Set the owner to the given address
-        self.owner.set(to);
-
-        // Emit the Minted event
-        evm::log(Minted { owner: to });
-
-        // Emit a custom log event indicating success
-        evm::log(LogMintingSuccess { message: "Minting successful, owner set.".to_string() });
-    }
-
     /// Get the symbol of the NFT (e.g., "PurrtunesNFT")
     pub fn symbol(&self) -> String {
         self.symbol.get_string()
@@ -90,6 +102,9 @@ impl Contract {
 
     /// Balance check function to see if the provided owner holds the NFT (1 if owned, 0 otherwise)
     pub fn balance_of(&self, owner: Address) -> U256 {
+        if self.total_supply.get() > U256::ZERO {
+            return self.balances.get(owner);
+        }
         if owner == self.owner.get() {
             U256::from(1)
         } else {
@@ -97,8 +112,13 @@ impl Contract {
         }
     }
 
-    /// Get the owner of a specific token ID (only supports token ID 1)
+    /// Get the owner of a specific token ID (only supports token ID 1 outside collection mode)
     pub fn owner_of(&self, token_id: U256) -> Result<Address, Vec<u8>> {
+        let token_owner = self.token_owners.get(token_id);
+        if token_owner != Address::ZERO {
+            return Ok(token_owner);
+        }
+
         // Check if the token_id is valid (only token ID 1 is allowed)
         assert!(token_id == U256::from(1), "Invalid token ID");
 
@@ -130,44 +150,115 @@ impl Contract {
     /// Generate Token URI: Returns a minimalistic JSON representing the NFT
     #[selector(name = "tokenURI")]
     pub fn token_uri(&self, token_id: U256) -> String {
+        // Collection mode: every minted token carries its own metadata
+        if self.token_owners.get(token_id) != Address::ZERO {
+            let token = self.tokens.getter(token_id);
+            return render_token_uri(
+                token.title.get_string(),
+                token.lyrics.get_string(),
+                token.meta.get_string(),
+                token.svg_template.get_string(),
+                token.music_data.get_string(),
+            );
+        }
+
         assert!(token_id == U256::from(1), "Invalid token ID");
 
-        // Decode stored Base64-encoded SVG template
-        let encoded_svg = self.svg_template.get_string();
-        let svg_bytes = base64_decode(&encoded_svg);
-        let svg_decoded = String::from_utf8(svg_bytes).expect("SVG not valid UTF-8");
+        render_token_uri(
+            self.title.get_string(),
+            self.lyrics.get_string(),
+            self.meta.get_string(),
+            self.svg_template.get_string(),
+            self.music_data.get_string(),
+        )
+    }
+
+    /// Title of any token, without building the whole tokenURI document
+    pub fn token_title(&self, token_id: U256) -> String {
+        self.stored_field(token_id, Field::Title)
+    }
 
-        // Encode again to Base64 for embedding in data URI
-        let svg_data_uri = format!("data:image/svg+xml;base64,{}", base64_encode(svg_decoded.as_bytes()));
+    /// Lyrics of any token (Decodes from Base64)
+    pub fn token_lyrics(&self, token_id: U256) -> String {
+        let encoded_lyrics = self.stored_field(token_id, Field::Lyrics);
+        String::from_utf8(base64_decode(&encoded_lyrics)).expect("Lyrics not valid UTF-8")
+    }
 
-        // Decode Base64-encoded metadata
-        let encoded_meta = self.meta.get_string();
-        let meta_bytes = base64_decode(&encoded_meta);
-        let meta_decoded = String::from_utf8(meta_bytes).expect("Meta not valid UTF-8");
+    /// Description (meta) of any token (Decodes from Base64)
+    pub fn token_description(&self, token_id: U256) -> String {
+        let encoded_meta = self.stored_field(token_id, Field::Meta);
+        String::from_utf8(base64_decode(&encoded_meta)).expect("Meta not valid UTF-8")
+    }
 
-        // Decode lyrics from Base64
-        let encoded_lyrics = self.lyrics.get_string();
-        let lyrics_bytes = base64_decode(&encoded_lyrics);
-        let lyrics_decoded = String::from_utf8(lyrics_bytes).expect("Lyrics not valid UTF-8");
+    /// Music link of any token, same as the `music` field of tokenURI
+    pub fn token_music(&self, token_id: U256) -> String {
+        format!("ipfs://{}", self.stored_field(token_id, Field::MusicData))
+    }
 
-        // Get the music IPFS URL (instead of directly embedding Base64)
-        let music_ipfs_url = self.music();
+    /// Artwork of any token as a data URI; the SVG is stored Base64-encoded already
+    pub fn token_image(&self, token_id: U256) -> String {
+        format!("data:image/svg+xml;base64,{}", self.stored_field(token_id, Field::Svg))
+    }
 
-        // Generate JSON metadata dynamically
-        let json = format!(
-            r#"{{"name":"{}","lyrics":"{}","description":"{}","image":"{}","music":"{}"}}"#,
-            self.title.get_string(),
-            lyrics_decoded,
-            meta_decoded,
-            svg_data_uri,
-            music_ipfs_url
-        );
+    /// Collection mode: set up an empty collection administered by `owner` (deployer only)
+    pub fn initialize_collection(&mut self, owner: Address, symbol: String, deploy_nonce: u64) {
+        assert_deployer(deploy_nonce);
+        assert!(self.owner.get() == Address::ZERO, "Already initialized!");
+        assert!(owner != Address::ZERO, "Invalid owner");
 
-        // Return data URI with encoded JSON
-        format!("data:application/json;base64,{}", base64_encode(json.as_bytes()))
+        self.owner.set(owner);
+        self.symbol.set_str(symbol);
+
+        // The owner and the deploying account may mint
+        self.minters.setter(owner).set(true);
+        self.minters.setter(msg::sender()).set(true);
+
+        evm::log(LogMintingSuccess { message: "Collection initialized successfully.".to_string() });
+    }
+
+    /// Collection mode: allow or revoke an account to mint (owner only)
+    pub fn set_minter(&mut self, minter: Address, allowed: bool) {
+        assert!(msg::sender() == self.owner.get(), "Only the owner can manage minters");
+        self.minters.setter(minter).set(allowed);
+    }
+
+    /// Collection mode: number of tokens minted so far
+    pub fn total_supply(&self) -> U256 {
+        self.total_supply.get()
     }
 
-    /// Initialize the contract with the given data (symbol, title, lyrics, meta, image, and music)
+    /// Collection mode: mint a new token with its own metadata, returns the new token id
+    pub fn mint_with_metadata(
+        &mut self,
+        to: Address,
+        title: String,
+        lyrics: String,
+        meta: String,
+        music_data: String,
+        svg_template: String,
+    ) -> U256 {
+        assert!(self.minters.get(msg::sender()), "Not allowed to mint");
+        assert!(to != Address::ZERO, "Invalid owner");
+
+        let token_id = self.total_supply.get() + U256::from(1);
+        self.total_supply.set(token_id);
+
+        let mut token = self.tokens.setter(token_id);
+        token.title.set_str(title);
+        token.lyrics.set_str(lyrics);
+        token.meta.set_str(meta);
+        token.music_data.set_str(music_data);
+        token.svg_template.set_str(svg_template);
+
+        self.token_owners.setter(token_id).set(to);
+        let balance = self.balances.get(to);
+        self.balances.setter(to).set(balance + U256::from(1));
+
+        evm::log(Transfer { from: Address::ZERO, to, tokenId: token_id });
+        token_id
+    }
+
+    /// Initialize the contract with the given data (symbol, title, lyrics, meta, image, and music), deployer only
     pub fn initialize_contract(
         &mut self,
         owner: Address,
@@ -177,7 +268,14 @@ impl Contract {
         meta: String,
         music_data: String,
         svg_template: String,  // Expecting SVG template as a string
+        deploy_nonce: u64,  // Nonce the deployer created this contract with
     ) {
+        assert_deployer(deploy_nonce);
+
+        // One-shot: once an owner is set (this or initializeCollection ran), nobody can take the contract over
+        assert!(self.owner.get() == Address::ZERO, "Already initialized!");
+        assert!(owner != Address::ZERO, "Invalid owner");
+
         // Set values for the contract
         self.symbol.set_str(symbol);
         self.title.set_str(title);
@@ -192,6 +290,86 @@ impl Contract {
     }
 }
 
+/// Stylus has no constructor, so the deployer proves itself by the nonce it created this contract with
+fn assert_deployer(deploy_nonce: u64) {
+    assert!(msg::sender().create(deploy_nonce) == contract::address(), "Only the deployer can initialize");
+}
+
+/// Metadata fields stored for every token
+enum Field {
+    Title,
+    Lyrics,
+    Meta,
+    MusicData,
+    Svg,
+}
+
+impl Contract {
+    /// Raw stored value of one field of `token_id`: a collection token, or token 1 of a single-song contract
+    fn stored_field(&self, token_id: U256, field: Field) -> String {
+        if self.token_owners.get(token_id) != Address::ZERO {
+            let token = self.tokens.getter(token_id);
+            return match field {
+                Field::Title => token.title.get_string(),
+                Field::Lyrics => token.lyrics.get_string(),
+                Field::Meta => token.meta.get_string(),
+                Field::MusicData => token.music_data.get_string(),
+                Field::Svg => token.svg_template.get_string(),
+            };
+        }
+
+        assert!(token_id == U256::from(1), "Invalid token ID");
+
+        match field {
+            Field::Title => self.title.get_string(),
+            Field::Lyrics => self.lyrics.get_string(),
+            Field::Meta => self.meta.get_string(),
+            Field::MusicData => self.music_data.get_string(),
+            Field::Svg => self.svg_template.get_string(),
+        }
+    }
+}
+
+/// Build the data URI with the JSON metadata from the stored (Base64-encoded) fields
+fn render_token_uri(
+    title: String,
+    encoded_lyrics: String,
+    encoded_meta: String,
+    encoded_svg: String,
+    music_data: String,
+) -> String {
+    // Decode stored Base64-encoded SVG template
+    let svg_bytes = base64_decode(&encoded_svg);
+    let svg_decoded = String::from_utf8(svg_bytes).expect("SVG not valid UTF-8");
+
+    // Encode again to Base64 for embedding in data URI
+    let svg_data_uri = format!("data:image/svg+xml;base64,{}", base64_encode(svg_decoded.as_bytes()));
+
+    // Decode Base64-encoded metadata
+    let meta_bytes = base64_decode(&encoded_meta);
+    let meta_decoded = String::from_utf8(meta_bytes).expect("Meta not valid UTF-8");
+
+    // Decode lyrics from Base64
+    let lyrics_bytes = base64_decode(&encoded_lyrics);
+    let lyrics_decoded = String::from_utf8(lyrics_bytes).expect("Lyrics not valid UTF-8");
+
+    // Get the music IPFS URL (instead of directly embedding Base64)
+    let music_ipfs_url = format!("ipfs://{}", music_data);
+
+    // Generate JSON metadata dynamically
+    let json = format!(
+        r#"{{"name":"{}","lyrics":"{}","description":"{}","image":"{}","music":"{}"}}"#,
+        title,
+        lyrics_decoded,
+        meta_decoded,
+        svg_data_uri,
+        music_ipfs_url
+    );
+
+    // Return data URI with encoded JSON
+    format!("data:application/json;base64,{}", base64_encode(json.as_bytes()))
+}
+
 /// Helper function for Base64 encoding
 fn base64_encode(input: &[u8]) -> String {
     const ALPHABET: &[u8] = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
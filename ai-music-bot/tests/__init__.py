@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot's modules import each other by their plain names, as `python ai_music_bot/bot.py` runs them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai_music_bot"))
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ai_music_bot import contract_build
+
+
+class EnsureContractWasmTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.builds = 0
+
+        async def source_hash(project_dir):
+            return "abc123"
+
+        async def build(project_dir, cached_path):
+            self.builds += 1
+            with open(cached_path, "wb") as f:
+                f.write(b"\0asm")
+
+        for name, value in (("CACHE_DIR", self.cache_dir.name), ("_wasm_path", None),
+                            ("source_hash", source_hash), ("_build", build)):
+            patcher = mock.patch.object(contract_build, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.hits, self.misses = contract_build.cache_hits.value, contract_build.cache_misses.value
+
+    def counted(self) -> tuple:
+        return (contract_build.cache_hits.value - self.hits, contract_build.cache_misses.value - self.misses)
+
+    async def test_every_deploy_is_counted(self):
+        path = await contract_build.ensure_contract_wasm()
+        for _ in range(3):
+            self.assertEqual(await contract_build.ensure_contract_wasm(), path)
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.counted(), (3, 1))
+
+    async def test_removed_artifact_is_rebuilt(self):
+        path = await contract_build.ensure_contract_wasm()
+        os.remove(path)
+        await contract_build.ensure_contract_wasm()
+
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(self.counted(), (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
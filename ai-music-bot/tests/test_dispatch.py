@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from telegram import Update
+from telegram.ext import CommandHandler
+
+import bot
+from loadtest import FAKE_TOKEN, StubTelegramRequest
+from webhook import stop_gracefully
+from webhook_harness import command_update
+
+
+class GracefulStopTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.telegram = StubTelegramRequest()
+        self.app = bot.build_application(token=FAKE_TOKEN, request=self.telegram)
+        self.replies = []
+
+        async def slow(update, context):
+            await asyncio.sleep(0.5)
+            self.replies.append(await update.message.reply_text("done"))
+
+        self.app.add_handler(CommandHandler("slow", slow), group=-1)
+
+    async def test_update_in_flight_at_shutdown_gets_its_reply(self):
+        async with self.app:
+            await self.app.start()
+            for _ in range(2):
+                # The second one waits in the user's queue behind the first
+                await self.app.update_queue.put(Update.de_json(command_update(1, "/slow"), self.app.bot))
+            await asyncio.sleep(0.1)
+            await asyncio.wait_for(stop_gracefully(self.app), 5)
+
+        self.assertEqual(len(self.replies), 2)
+        self.assertEqual(self.telegram.calls["sendMessage"], 2)
+
+    async def test_drain_timeout_cancels_what_is_left(self):
+        self.app.update_processor.drain_timeout = 0.2
+        async with self.app:
+            await self.app.start()
+            await self.app.update_queue.put(Update.de_json(command_update(2, "/slow"), self.app.bot))
+            await asyncio.sleep(0.1)
+            await asyncio.wait_for(stop_gracefully(self.app), 5)
+
+        self.assertEqual(self.replies, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
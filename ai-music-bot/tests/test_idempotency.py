@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from ai_music_bot import main
+from ai_music_bot.idempotency import IdempotencyConflict, IdempotencyStore
+
+
+class IdempotencyStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = IdempotencyStore(max_keys=3, ttl=60)
+        self.calls = 0
+
+    async def job(self, result="minted", delay=0.0, error=None):
+        self.calls += 1
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return result
+
+    async def test_retry_attaches_to_the_running_job(self):
+        first = asyncio.create_task(self.store.run("k", lambda: self.job(delay=0.05), "f"))
+        await asyncio.sleep(0)
+        second = await self.store.run("k", lambda: self.job("other"), "f")
+
+        self.assertEqual((await first, second), ("minted", "minted"))
+        self.assertEqual(self.calls, 1)
+        # Finished jobs answer later retries too
+        self.assertEqual(await self.store.run("k", lambda: self.job("other"), "f"), "minted")
+        self.assertEqual(self.calls, 1)
+
+    async def test_client_giving_up_does_not_cancel_the_job(self):
+        first = asyncio.create_task(self.store.run("k", lambda: self.job(delay=0.05), "f"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+        self.assertEqual(await self.store.run("k", lambda: self.job("other"), "f"), "minted")
+        self.assertEqual(self.calls, 1)
+
+    async def test_failed_job_is_forgotten(self):
+        with self.assertRaises(RuntimeError):
+            await self.store.run("k", lambda: self.job(error=RuntimeError("reverted")), "f")
+        await asyncio.sleep(0)  # Done callbacks run on the next loop iteration
+
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(await self.store.run("k", self.job, "f"), "minted")
+        self.assertEqual(self.calls, 2)
+
+    async def test_key_reused_for_another_request(self):
+        await self.store.run("k", self.job, "f1")
+        with self.assertRaises(IdempotencyConflict):
+            await self.store.run("k", self.job, "f2")
+        self.assertEqual(self.calls, 1)
+
+    async def test_finished_jobs_expire(self):
+        self.store.ttl = 0.02
+        await self.store.run("old", self.job, "f")
+        await asyncio.sleep(0.03)
+        await self.store.run("new", self.job, "f")
+        self.assertEqual(list(self.store._jobs), ["new"])
+
+    async def test_running_jobs_do_not_expire(self):
+        self.store.ttl = 0.02
+        running = asyncio.create_task(self.store.run("slow", lambda: self.job(delay=0.1), "f"))
+        await asyncio.sleep(0.03)
+        await self.store.run("new", self.job, "f")
+        self.assertIn("slow", self.store._jobs)
+        await running
+
+    async def test_oldest_finished_jobs_are_evicted_first(self):
+        running = asyncio.create_task(self.store.run("running", lambda: self.job(delay=0.05), "f"))
+        await asyncio.sleep(0)
+        for key in ("a", "b", "c", "d"):
+            await self.store.run(key, self.job, "f")
+
+        self.assertEqual(list(self.store._jobs), ["running", "c", "d"])
+        await running
+
+
+class GenerateMusicIdempotencyTest(unittest.TestCase):
+    BODY = dict(owner_address="0xo", symbol="M", title="T", lyrics="l", meta="m",
+                music_data="ipfs://QmA", svg_template="<svg/>")
+
+    def setUp(self):
+        async def mint(request):
+            self.minted.append(request.title)
+            return main.MusicNFTResponse(transaction_hash="0x1", block_number=1, block_hash="0xb",
+                                         deployed_at="now", contract_address="0xc", gas_used=1)
+
+        self.minted = []
+        patches = [mock.patch.object(main, "mint_music_nft", mint),
+                   mock.patch.object(main, "mint_jobs", IdempotencyStore())]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+
+    def test_same_key_other_body_is_a_conflict(self):
+        headers = {"Idempotency-Key": "key-1"}
+        first = self.client.post("/generate_music", json=self.BODY, headers=headers)
+        retry = self.client.post("/generate_music", json=dict(self.BODY, svg_template="<svg>new</svg>"),
+                                 headers=headers)
+        other = self.client.post("/generate_music", json=dict(self.BODY, title="Other"), headers=headers)
+
+        self.assertEqual(first.json(), retry.json())
+        self.assertEqual(other.status_code, 409)
+        self.assertEqual(self.minted, ["T"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from ai_music_bot.ipfs_cid import CHUNK_SIZE, b58encode, cid_v0, file_cid
+
+
+def _cid(block: bytes) -> str:
+    return b58encode(b"\x12\x20" + hashlib.sha256(block).digest())
+
+
+class CidV0Test(unittest.TestCase):
+    # From `ipfs add --cid-version=0`
+    VECTORS = {
+        b"": "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH",
+        b"hello world\n": "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o",
+    }
+
+    def test_single_chunk(self):
+        for data, expected in self.VECTORS.items():
+            self.assertEqual(cid_v0(data), expected)
+
+    def test_two_chunks(self):
+        # The balanced layout of go-unixfs, encoded by hand: the first leaf is a File,
+        # the second a Raw, and the root a File listing both with their sizes
+        first, second = b"a" * CHUNK_SIZE, b"b" * 10
+        leaf1 = bytes.fromhex("0a8a8010" "0802" "12808010") + first + bytes.fromhex("18808010")
+        leaf2 = bytes.fromhex("0a10" "0800" "120a") + second + bytes.fromhex("180a")
+        root = (bytes.fromhex("122a0a221220") + hashlib.sha256(leaf1).digest() + bytes.fromhex("1200188e8010")
+                + bytes.fromhex("12280a221220") + hashlib.sha256(leaf2).digest() + bytes.fromhex("12001812")
+                + bytes.fromhex("0a0c" "0802" "188a8010" "20808010" "200a"))
+        self.assertEqual(cid_v0(first + second), _cid(root))
+
+    def test_file_matches_bytes(self):
+        data = os.urandom(2 * CHUNK_SIZE + 123)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertEqual(file_cid(f.name), cid_v0(data))
+
+    @unittest.skipIf(shutil.which("ipfs") is None, "needs the ipfs CLI")
+    def test_matches_ipfs_add(self):
+        # Multi-level DAGs (more than 174 chunks) are only checked against the real thing
+        for size in (CHUNK_SIZE + 1, 3 * CHUNK_SIZE, 175 * CHUNK_SIZE + 7):
+            data = os.urandom(size)
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(data)
+                f.flush()
+                expected = subprocess.run(["ipfs", "add", "-n", "-Q", "--cid-version=0", f.name],
+                                          capture_output=True, text=True, check=True).stdout.strip()
+            self.assertEqual(cid_v0(data), expected, f"{size} bytes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from ai_music_bot import main
+from ai_music_bot.pin_gate import PinError, PinGate
+from ai_music_bot.signers import SignerPool
+
+
+class PinGateTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.gate = PinGate(timeout=1, ttl=60, max_entries=10)
+
+    async def test_confirmed_before_the_mint_waits(self):
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+        await self.gate.wait("QmA")
+        # Kept for retried mints
+        await self.gate.wait("QmA")
+
+    async def test_confirmed_while_the_mint_waits(self):
+        waiter = asyncio.create_task(self.gate.wait("QmA"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+        await waiter
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+
+    async def test_mismatch(self):
+        waiter = asyncio.create_task(self.gate.wait("QmA"))
+        await asyncio.sleep(0)
+        self.assertEqual(self.gate.confirm("QmA", "QmB"), "mismatch")
+
+        with self.assertRaisesRegex(PinError, "doesn't match"):
+            await waiter
+        self.assertEqual(len(self.gate), 0)
+
+    async def test_failed_upload_then_retried(self):
+        self.assertEqual(self.gate.confirm("QmA", error="upload failed"), "failed")
+        with self.assertRaisesRegex(PinError, "upload failed"):
+            await self.gate.wait("QmA")
+
+        # A retry of the mint waits for a new upload, which may succeed
+        waiter = asyncio.create_task(self.gate.wait("QmA"))
+        await asyncio.sleep(0)
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+        await waiter
+
+    async def test_failed_upload_confirmed_again_before_any_mint(self):
+        self.assertEqual(self.gate.confirm("QmA", pinned_cid=None), "failed")
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+        await self.gate.wait("QmA")
+
+    async def test_timeout_keeps_the_pin_for_a_retry(self):
+        self.gate.timeout = 0.05
+        with self.assertRaises(TimeoutError):
+            await self.gate.wait("QmA")
+
+        self.assertEqual(self.gate.confirm("QmA", "QmA"), "pinned")
+        await self.gate.wait("QmA")
+
+    async def test_unconfirmed_pins_expire(self):
+        self.gate.ttl = 0.02
+        waiter = asyncio.create_task(self.gate.wait("QmA"))
+        await asyncio.sleep(0.03)
+        self.gate.confirm("QmB", "QmB")  # Any later use sweeps expired entries
+
+        with self.assertRaisesRegex(PinError, "expired"):
+            await waiter
+        self.assertEqual(len(self.gate), 1)
+
+    async def test_oldest_entries_go_over_max_entries(self):
+        self.gate.max_entries = 2
+        for cid in ("QmA", "QmB", "QmC"):
+            self.gate.confirm(cid, cid)
+
+        self.assertEqual(list(self.gate._pins), ["QmB", "QmC"])
+
+
+class MintSongPinTest(unittest.IsolatedAsyncioTestCase):
+    REQUEST = dict(owner_address="0xo", symbol="M", title="T", lyrics="l", meta="m",
+                   music_data="ipfs://QmA", svg_template="<svg/>", pending_cid="QmA")
+
+    async def asyncSetUp(self):
+        self.gate = PinGate(timeout=1)
+        self.pool = SignerPool(keys=["k1"])
+        self.pool.signers[0].address = "0xsigner"
+        self.initialized = []
+
+        async def deploy(signer):
+            return "0xcontract", 7
+
+        async def initialize(**kwargs):
+            self.initialized.append(kwargs)
+            return main.MusicNFTResponse(transaction_hash="0x1", block_number=1, block_hash="0xb",
+                                         deployed_at="now", contract_address=kwargs["contract_address"],
+                                         gas_used=1)
+
+        for name, value in (("pin_gate", self.gate), ("signer_pool", self.pool), ("COLLECTION_MODE", False),
+                            ("PIN_CONFIRM_SECRET", "secret"), ("deploy_contract", deploy),
+                            ("initialize_contract", initialize)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_failed_pin_aborts_before_initializing(self):
+        mint = asyncio.create_task(main.mint_song(main.MusicRequest(**self.REQUEST)))
+        await asyncio.sleep(0.01)
+        signer = self.pool.signers[0]
+        # The signer isn't held through the wait
+        self.assertFalse(signer.lock.locked())
+
+        self.gate.confirm("QmA", "QmOther")
+        with self.assertRaises(PinError):
+            await mint
+        self.assertEqual(self.initialized, [])
+        self.assertEqual(signer.in_flight, 0)
+
+    async def test_confirmed_pin_initializes_with_the_deployer(self):
+        mint = asyncio.create_task(main.mint_song(main.MusicRequest(**self.REQUEST)))
+        await asyncio.sleep(0.01)
+        self.gate.confirm("QmA", "QmA")
+
+        response = await mint
+        self.assertEqual(response.signer_address, "0xsigner")
+        self.assertEqual(len(self.initialized), 1)
+        self.assertEqual(self.initialized[0]["deploy_nonce"], 7)
+        self.assertIs(self.initialized[0]["signer"], self.pool.signers[0])
+
+    async def test_music_data_must_point_at_the_pending_cid(self):
+        with self.assertRaises(ValueError):
+            await main.mint_song(main.MusicRequest(**dict(self.REQUEST, music_data="ipfs://QmB")))
+
+
+if __name__ == "__main__":
+    unittest.main()
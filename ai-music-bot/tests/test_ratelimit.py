@@ -0,0 +1,96 @@
+import asyncio
+import time
+import unittest
+
+from ratelimit import OutboundScheduler, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_take_and_refill(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        bucket.take()
+        bucket.take()
+        self.assertAlmostEqual(bucket.delay(now), 0.5)
+        self.assertEqual(bucket.delay(now + 0.5), 0)
+        self.assertFalse(bucket.full(now + 0.5))
+        # Never refills past its capacity
+        self.assertTrue(bucket.full(now + 10))
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        now = bucket.updated
+        bucket.pause(2)
+        self.assertAlmostEqual(bucket.delay(now), 2)
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sent = []
+
+    async def asyncTearDown(self):
+        await self.scheduler.shutdown()
+
+    async def start(self, **kwargs):
+        self.scheduler = OutboundScheduler(**{"global_rate": 1000, "chat_rate": 20, "chat_burst": 1, **kwargs})
+        await self.scheduler.initialize()
+
+    def request(self, endpoint: str, chat_id: int, text: str, message_id: int = None, duration: float = 0):
+        async def callback():
+            self.sent.append(("start", chat_id, text))
+            await asyncio.sleep(duration)
+            self.sent.append(("end", chat_id, text))
+            return text
+
+        data = {"chat_id": chat_id, "text": text}
+        if message_id is not None:
+            data["message_id"] = message_id
+        return asyncio.create_task(self.scheduler.process_request(callback, (), {}, endpoint, data, None))
+
+    def started(self) -> list:
+        return [(chat_id, text) for event, chat_id, text in self.sent if event == "start"]
+
+    async def test_queued_edits_collapse_into_the_latest(self):
+        await self.start(chat_rate=5)
+        first = self.request("sendMessage", 1, "sent")
+        edits = [self.request("editMessageText", 1, f"edit {i}", message_id=7) for i in range(3)]
+        await asyncio.gather(first, *edits)
+
+        self.assertEqual(self.started(), [(1, "sent"), (1, "edit 2")])
+        # Superseded callers returned right away, the latest got the real result
+        self.assertEqual([edit.result() for edit in edits], [True, True, "edit 2"])
+
+    async def test_chats_are_served_round_robin(self):
+        await self.start()
+        requests = [self.request("sendMessage", 1, f"a{i}") for i in range(3)]
+        requests.append(self.request("sendMessage", 2, "b0"))
+        await asyncio.gather(*requests)
+
+        self.assertEqual(self.started(), [(1, "a0"), (2, "b0"), (1, "a1"), (1, "a2")])
+
+    async def test_edits_of_one_message_go_out_one_at_a_time(self):
+        await self.start(chat_rate=1000, chat_burst=10)
+        slow = self.request("editMessageText", 1, "slow", message_id=7, duration=0.2)
+        await asyncio.sleep(0.05)
+        fast = self.request("editMessageText", 1, "fast", message_id=7)
+        await asyncio.gather(slow, fast)
+
+        self.assertEqual(self.sent, [("start", 1, "slow"), ("end", 1, "slow"), ("start", 1, "fast"), ("end", 1, "fast")])
+
+    async def test_chat_rate_is_respected(self):
+        await self.start(chat_rate=10)
+        start = time.perf_counter()
+        await asyncio.gather(*(self.request("sendMessage", 1, str(i)) for i in range(3)))
+        # One right away, then one every 0.1s
+        self.assertGreaterEqual(time.perf_counter() - start, 0.18)
+
+    async def test_requests_after_shutdown_fail(self):
+        await self.start()
+        await self.scheduler.shutdown()
+        with self.assertRaises(RuntimeError):
+            await self.request("sendMessage", 1, "late")
+
+
+if __name__ == "__main__":
+    unittest.main()
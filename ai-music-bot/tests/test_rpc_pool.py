@@ -0,0 +1,62 @@
+import time
+import unittest
+
+from ai_music_bot.rpc_pool import RpcPool, is_endpoint_error
+
+
+class EndpointErrorTest(unittest.TestCase):
+    def test_node_problems(self):
+        for stderr in (
+            "Error: error sending request for url (http://localhost:8547/): Connection refused (os error 111)",
+            "Error: HTTP error 502 with body: <html>Bad Gateway</html>",
+            "Error: HTTP error 429 with body: Too Many Requests",
+            "Error: request timed out",
+        ):
+            self.assertTrue(is_endpoint_error(stderr), stderr)
+
+    def test_transaction_problems(self):
+        for stderr in (
+            "Error: server returned an error response: error code -32000: insufficient funds for gas * price + value",
+            "Error: server returned an error response: error code -32000: nonce too low: next nonce 5, tx nonce 4",
+            "Error: execution reverted: Already initialized!",
+            "",
+        ):
+            self.assertFalse(is_endpoint_error(stderr), stderr)
+
+
+class TrackTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = RpcPool(urls=["http://a", "http://b"], failure_threshold=2, cooldown=30)
+        self.a = self.pool.endpoints["http://a"]
+
+    def test_connection_errors_trip_the_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError), self.pool.track("http://a"):
+                raise ConnectionError("refused")
+
+        self.assertFalse(self.a.available(time.monotonic()))
+        self.assertEqual(self.pool.read_url(), "http://b")
+
+    def test_other_errors_count_as_an_answer(self):
+        with self.assertRaises(ConnectionError), self.pool.track("http://a"):
+            raise ConnectionError("refused")
+        for _ in range(3):
+            with self.assertRaises(RuntimeError), self.pool.track("http://a"):
+                raise RuntimeError("nonce too low")
+
+        self.assertEqual(self.a.failures, 0)
+        self.assertTrue(self.a.available(time.monotonic()))
+        self.assertIsNone(self.a.latency)
+
+    def test_latency_only_from_round_trips(self):
+        with self.pool.track("http://a", latency=False):
+            time.sleep(0.05)
+        self.assertIsNone(self.a.latency)
+
+        with self.pool.track("http://a"):
+            pass
+        self.assertLess(self.a.latency, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
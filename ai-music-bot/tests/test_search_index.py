@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from ai_music_bot.search_index import SearchIndex, SongDocument
+
+
+def _song(address: str, title: str, lyrics: str = "", description: str = "", token_id: int = 1) -> SongDocument:
+    return SongDocument(contract_address=address, token_id=token_id, title=title, lyrics=lyrics,
+                        description=description)
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex(path=None)
+
+    def test_title_match_outranks_lyrics_match(self):
+        self.index.add(_song("0xA", "Midnight rain", "la la la"))
+        self.index.add(_song("0xB", "Sunny day", "walking in the rain"))
+        self.index.add(_song("0xC", "Other", "nothing here"))
+
+        results = self.index.search("rain")
+        self.assertEqual([r["contract_address"] for r in results], ["0xA", "0xB"])
+        self.assertGreater(results[0]["score"], results[1]["score"])
+        self.assertEqual(results[1]["snippet"], "walking in the rain")
+
+    def test_rare_term_outranks_common_term(self):
+        for i in range(5):
+            self.index.add(_song(f"0x{i}", "cat song", "purr"))
+        self.index.add(_song("0xdog", "dog song", "woof"))
+
+        self.assertEqual(self.index.search("cat dog")[0]["contract_address"], "0xdog")
+
+    def test_shorter_document_ranks_higher_for_same_frequency(self):
+        self.index.add(_song("0xshort", "x", "meow"))
+        self.index.add(_song("0xlong", "y", "meow " + "filler " * 50))
+        self.index.add(_song("0xnone", "z", "nothing"))
+
+        self.assertEqual([r["contract_address"] for r in self.index.search("meow")], ["0xshort", "0xlong"])
+
+    def test_reindexing_replaces_the_document(self):
+        self.index.add(_song("0xA", "Old title", "old words"))
+        length = self.index._total_length
+        self.index.add(_song("0xa", "New title", "fresh words"))  # Same key, addresses are case-insensitive
+
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search("old"), [])
+        self.assertEqual(self.index.search("fresh")[0]["title"], "New title")
+        self.assertNotIn("old", self.index._postings)
+        self.assertAlmostEqual(self.index._total_length, length)
+
+    def test_tokens_split_on_escaped_newlines(self):
+        self.index.add(_song("0xA", "t", "first line\\nsecond line"))
+
+        results = self.index.search("second")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["snippet"], "second line")
+
+    def test_empty_query_and_index(self):
+        self.assertEqual(self.index.search("anything"), [])
+        self.index.add(_song("0xA", "title"))
+        self.assertEqual(self.index.search("  ,. "), [])
+
+    def test_load_replays_the_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.jsonl")
+            index = SearchIndex(path=path)
+            for document in (_song("0xA", "Purr ballad"), _song("0xB", "Hiss"), _song("0xA", "Meow ballad")):
+                index.add(document)
+                index.persist(document)
+
+            replayed = SearchIndex(path=path)
+            replayed.load()
+
+            # The later entry of a song wins
+            self.assertEqual(len(replayed), 2)
+            self.assertEqual(replayed.search("purr"), [])
+            self.assertEqual(replayed.search("meow")[0]["contract_address"], "0xA")
+            self.assertEqual(replayed._total_length, index._total_length)
+
+    def test_load_without_log(self):
+        index = SearchIndex(path="/nonexistent/index.jsonl")
+        index.load()
+        self.assertEqual(len(index), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from ai_music_bot import sessions
+from ai_music_bot.sessions import SessionStore, UserSession
+
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch.object(sessions, "time", SimpleNamespace(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = SessionStore(max_users=2, ttl=10)
+
+    def test_least_recently_used_is_evicted(self):
+        self.store[1] = UserSession(title="one")
+        self.store[2] = UserSession(title="two")
+        self.store.get(1)
+        self.store[3] = UserSession(title="three")
+
+        self.assertEqual(len(self.store), 2)
+        self.assertNotIn(2, self.store)
+        self.assertEqual(self.store[1].title, "one")
+        self.assertEqual(self.store.evictions, {"lru": 1, "ttl": 0})
+
+    def test_idle_sessions_expire(self):
+        self.store[1] = UserSession()
+        self.now = 5
+        self.store[2] = UserSession()
+        self.now = 12
+
+        self.assertIsNone(self.store.get(1))
+        self.assertIsNotNone(self.store.get(2))
+        self.assertEqual(self.store.evictions, {"lru": 0, "ttl": 1})
+
+    def test_use_keeps_a_session_alive(self):
+        self.store[1] = UserSession()
+        for self.now in (8, 16, 24):
+            self.assertIn(1, self.store)
+
+    def test_expired_sessions_are_swept_on_write(self):
+        self.store[1] = UserSession()
+        self.now = 11
+        self.store[2] = UserSession()
+
+        self.assertEqual(list(self.store._sessions), [2])
+        self.assertTrue(self.store.expired(1))
+
+    def test_pinned_session_survives_lru_and_ttl(self):
+        self.store[1] = UserSession(title="minting")
+        self.store.pin(1)
+        self.store.pin(1)
+        self.store[2] = UserSession()
+        self.store[3] = UserSession()
+
+        self.assertEqual(self.store[1].title, "minting")
+        self.assertNotIn(2, self.store)
+
+        # Idle for longer than the TTL, still there while pinned
+        self.now = 30
+        self.store[4] = UserSession()
+        self.assertIn(1, self.store)
+
+        # Pins are counted, the session is evictable after the last unpin
+        self.store.unpin(1)
+        self.store[5] = UserSession()
+        self.assertIn(1, self.store)
+        self.store.unpin(1)
+        self.now = 50
+        self.store[6] = UserSession()
+        self.assertNotIn(1, self.store)
+        self.assertTrue(self.store.expired(1))
+
+    def test_all_pinned_goes_over_the_limit(self):
+        for key in (1, 2, 3):
+            self.store.pin(key)
+            self.store[key] = UserSession()
+        self.assertEqual(len(self.store), 3)
+
+        # The new session stays even though only pinned ones are left to make room
+        self.store.unpin(1)
+        self.store[4] = UserSession()
+        self.assertEqual(sorted(self.store._sessions), [2, 3, 4])
+
+        self.store.unpin(2)
+        self.store.unpin(3)
+        self.store[5] = UserSession()
+        self.assertEqual(sorted(self.store._sessions), [4, 5])
+
+    def test_expired_tells_evicted_from_unknown(self):
+        self.store[1] = UserSession()
+        self.store[2] = UserSession()
+        self.store[3] = UserSession()
+
+        self.assertTrue(self.store.expired(1))
+        self.assertFalse(self.store.expired(2))
+        self.assertFalse(self.store.expired(99))
+
+        # Coming back clears it
+        self.store[1] = UserSession()
+        self.assertFalse(self.store.expired(1))
+
+    def test_evicted_keys_are_bounded(self):
+        for key in range(10):
+            self.store[key] = UserSession()
+
+        self.assertEqual(len(self.store._evicted), 2)
+        self.assertEqual(list(self.store._evicted), [6, 7])
+        self.assertFalse(self.store.expired(0))
+
+    def test_pop_is_not_an_eviction(self):
+        self.store[1] = UserSession()
+        self.assertIsNotNone(self.store.pop(1))
+        self.assertFalse(self.store.expired(1))
+        self.assertIsNone(self.store.pop(1))
+
+    def test_stats(self):
+        self.store[1] = UserSession(title="a title")
+        stats = self.store.stats()
+        self.assertEqual(stats["sessions"], 1)
+        self.assertEqual(stats["max_users"], 2)
+        self.assertGreater(stats["avg_session_bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
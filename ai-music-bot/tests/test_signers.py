@@ -0,0 +1,59 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from ai_music_bot import signers
+from ai_music_bot.signers import SignerPool
+
+
+class FakeExecutor:
+    """Answers `cast wallet address` and `cast balance`; `wallet` fails while `down` is set."""
+
+    def __init__(self):
+        self.down = True
+
+    async def run(self, kind, *command):
+        if command[1] == "wallet":
+            if self.down:
+                return SimpleNamespace(returncode=1, stdout="", stderr="keystore unavailable")
+            return SimpleNamespace(returncode=0, stdout=f"0x{command[-1]}\n", stderr="")
+        return SimpleNamespace(returncode=0, stdout=str(10 ** 18), stderr="")
+
+
+class UnresolvedSignerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = FakeExecutor()
+        patcher = mock.patch.object(signers, "executor", self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = SignerPool(keys=["k1"], check_interval=3600)
+        self.addCleanup(self.pool.stop)
+
+    async def test_unresolved_signer_is_kept_and_retried(self):
+        await self.pool.start()
+        self.assertEqual(len(self.pool.signers), 1)
+        with self.assertRaises(RuntimeError):
+            async with self.pool.acquire():
+                pass
+
+        self.executor.down = False
+        await self.pool.check_balances()
+
+        async with self.pool.acquire() as signer:
+            self.assertEqual(signer.address, "0xk1")
+        self.assertEqual(signer.balance, 10 ** 18)
+
+    async def test_only_resolved_signers_get_jobs(self):
+        self.pool = SignerPool(keys=["k1", "k2"], check_interval=3600)
+        self.addCleanup(self.pool.stop)
+        self.executor.down = False
+        await self.pool.start()
+        self.pool.signers[0].address = None  # As if k1 hadn't resolved
+
+        for _ in range(3):
+            async with self.pool.acquire() as signer:
+                self.assertEqual(signer.address, "0xk2")
+
+
+if __name__ == "__main__":
+    unittest.main()